@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the clatex builder.
+
+Each module can be run on its own, e.g.::
+
+    python -m benchmarks.bench_titles
+"""
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of a full clatex build of a synthetic project.
+
+Generates a project with :mod:`benchmarks.corpus`, builds it and reports the
+time spent in each phase of the build:
+
+read
+    reading the sources (everything before ``LaTeXBuilder.write``),
+assemble
+    ``LaTeXBuilder.assemble_doctree`` without the reference resolution,
+resolve
+    ``env.resolve_references``,
+walk
+    the walk of ``CustomLaTeXTranslator`` over the doctrees,
+astext
+    ``CustomLaTeXTranslator.astext``,
+finish
+    ``LaTeXBuilder.finish``.
+
+The results are written as JSON, so that runs can be compared over time::
+
+    python -m benchmarks.bench_build [--docs 200] [--output results.json]
+"""
+
+from __future__ import print_function
+
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import optparse
+from os import path
+
+import sphinx
+from sphinx.application import Sphinx
+
+from sphinx_clatex import writer
+from benchmarks.corpus import generate
+
+PHASES = ('read', 'assemble', 'resolve', 'walk', 'astext', 'finish')
+
+
+class Timings(dict):
+
+    def __init__(self):
+        dict.__init__(self, ((phase, 0.0) for phase in PHASES))
+
+    def timed(self, phase, function):
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self[phase] += time.time() - start
+        return wrapper
+
+
+def timed_writer(timings):
+
+    class TimedLaTeXWriter(writer.CustomLaTeXWriter):
+
+        def translate(self):
+            visitor = self.translator(self.document)
+            timings.timed('walk', self.document.walkabout)(visitor)
+            visitor.finish_chapters()
+            self.output = timings.timed('astext', visitor.astext)()
+
+    return TimedLaTeXWriter
+
+
+def build(srcdir, workdir):
+    """Build the project in ``srcdir``, return the timings of the phases."""
+    timings = Timings()
+    app = Sphinx(srcdir, srcdir, path.join(workdir, 'out'),
+                 path.join(workdir, 'doctrees'), 'clatex',
+                 status=None, warning=sys.stderr, freshenv=True)
+    builder = app.builder
+    builder.WriterClass = timed_writer(timings)
+    started = {}
+
+    # resolve_references is called by assemble_doctree: its time is
+    # subtracted from the assemble phase below.  It is wrapped only once
+    # writing starts, since the environment is pickled before (and a
+    # function in its __dict__ cannot be).
+    write = builder.write
+    def timed_write(*args, **kwargs):
+        started['write'] = time.time()
+        env = builder.env
+        env.resolve_references = timings.timed('resolve',
+                                               env.resolve_references)
+        try:
+            return write(*args, **kwargs)
+        finally:
+            del env.resolve_references
+    builder.write = timed_write
+
+    builder.assemble_doctree = timings.timed('assemble',
+                                             builder.assemble_doctree)
+    builder.finish = timings.timed('finish', builder.finish)
+
+    start = time.time()
+    app.build(True)
+    timings['total'] = time.time() - start
+    timings['read'] = started['write'] - start
+    timings['assemble'] -= timings['resolve']
+    return timings
+
+
+def main(argv=sys.argv[1:]):
+    parser = optparse.OptionParser(usage=__doc__.strip())
+    parser.add_option('--docs', type='int', default=200)
+    parser.add_option('--fanout', type='int', default=4)
+    parser.add_option('--blocks', type='int', default=3)
+    parser.add_option('--targets', type='int', default=1)
+    parser.add_option('--repeat', type='int', default=1)
+    parser.add_option('--output', default='bench_build.json',
+                      help='JSON file the results are written to')
+    parser.add_option('--keep', action='store_true',
+                      help='keep the generated project')
+    options, args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='clatex-bench-')
+    try:
+        srcdir = generate(path.join(workdir, 'src'), options.docs,
+                          options.fanout, options.blocks, options.targets)
+        runs = []
+        for run in range(options.repeat):
+            runs.append(build(srcdir, path.join(workdir, 'build%d' % run)))
+    finally:
+        if options.keep:
+            print('project kept in %s' % workdir)
+        else:
+            shutil.rmtree(workdir)
+
+    results = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'sphinx': sphinx.__version__,
+        'corpus': {
+            'docs': options.docs,
+            'fanout': options.fanout,
+            'blocks': options.blocks,
+            'targets': options.targets,
+        },
+        'runs': runs,
+    }
+    with open(options.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    for phase in PHASES + ('total',):
+        print('%-10s %s' % (phase, ' '.join('%8.3f' % run[phase]
+                                            for run in runs)))
+    print('results written to %s' % options.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the escaping of text nodes for LaTeX.
+
+Collects the text nodes of a corpus and escapes them with
+``unicode.translate`` over ``tex_escape_map`` (what Sphinx does) and with
+:class:`sphinx_clatex.escape.TeXEscaper`, checking that the output is the
+same.  The corpus is either the pickled doctrees of a built project (its
+``doctrees`` directory) or a directory of reStructuredText sources, which
+Sphinx reads to a temporary doctree directory; without one, a synthetic
+project is generated::
+
+    python -m benchmarks.bench_escape [--repeat 5] [DOCTREEDIR | SOURCEDIR]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import optparse
+import cPickle as pickle
+from os import path
+from StringIO import StringIO
+
+from docutils import nodes
+from sphinx.application import Sphinx
+from sphinx.util import texescape
+
+from sphinx_clatex.escape import TeXEscaper
+from sphinx_clatex.directives import TheoremNode
+from benchmarks.corpus import generate
+
+
+def files(directory, extension):
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for filename in sorted(filenames):
+            if filename.endswith(extension):
+                yield path.join(dirpath, filename)
+
+
+def find_global(module, name):
+    # the theorem node classes are created by newtheorem() in the setup of
+    # the project, which is not run here
+    __import__(module)
+    try:
+        return getattr(sys.modules[module], name)
+    except AttributeError:
+        if module != 'sphinx_clatex.directives' or \
+                not name.startswith('thmnode_'):
+            raise
+        thmnode = type(name, (TheoremNode,), {})
+        setattr(sys.modules[module], name, thmnode)
+        return thmnode
+
+
+def read_doctrees(directory):
+    for filename in files(directory, '.doctree'):
+        with open(filename, 'rb') as f:
+            unpickler = pickle.Unpickler(f)
+            unpickler.find_global = find_global
+            yield unpickler.load()
+
+
+def read_sources(directory, doctreedir):
+    """
+    Read the sources in ``directory`` with Sphinx (the directives and roles
+    of Sphinx and of sphinx_clatex need its environment), which pickles
+    their doctrees to ``doctreedir``.  Without a ``conf.py`` just the
+    sphinx_clatex extension is loaded and the master document is ``index``
+    (or any other source, if there is none).
+    """
+    if path.isfile(path.join(directory, 'conf.py')):
+        confdir, overrides = directory, {}
+    else:
+        sources = [path.relpath(filename, directory)[:-4]
+                   for filename in files(directory, '.rst')]
+        master = 'index' if 'index' in sources else sources[0]
+        confdir, overrides = None, {'extensions': ['sphinx_clatex'],
+                                    'master_doc': master}
+    # nothing is written: the builder only has to exist
+    app = Sphinx(directory, confdir, path.join(doctreedir, 'out'),
+                 doctreedir, 'latex', overrides, status=None,
+                 warning=StringIO(), freshenv=True)
+    app.env.update(app.config, app.srcdir, app.doctreedir, app)
+
+
+def collect_texts(directory):
+    tmpdir = None
+    if not any(files(directory, '.doctree')):
+        tmpdir = tempfile.mkdtemp()
+        read_sources(directory, tmpdir)
+        directory = tmpdir
+    try:
+        texts = []
+        for doctree in read_doctrees(directory):
+            texts.extend(node.astext()
+                         for node in doctree.traverse(nodes.Text))
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+    return texts
+
+
+def bench(texts, repeat):
+    escape_map = texescape.tex_escape_map
+
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        expected = [unicode(text).translate(escape_map) for text in texts]
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    translate = best
+
+    # a new escaper for every round, so that the first round shows the cost
+    # with an empty memo
+    rounds = []
+    for i in range(repeat):
+        escaper = TeXEscaper(escape_map)
+        start = time.time()
+        found = [escaper(text) for text in texts]
+        first = time.time() - start
+        start = time.time()
+        found = [escaper(text) for text in texts]
+        rounds.append((first, time.time() - start))
+    if found != expected:
+        raise AssertionError('TeXEscaper and unicode.translate differ')
+    return translate, min(cold for cold, warm in rounds), \
+        min(warm for cold, warm in rounds)
+
+
+def main(argv=sys.argv[1:]):
+    parser = optparse.OptionParser(usage=__doc__.strip())
+    parser.add_option('--repeat', type='int', default=5)
+    parser.add_option('--docs', type='int', default=200,
+                      help='documents of the generated project')
+    options, args = parser.parse_args(argv)
+    texescape.init()
+
+    tmpdir = None
+    if args:
+        directory = args[0]
+    else:
+        tmpdir = tempfile.mkdtemp()
+        directory = generate(tmpdir, options.docs)
+    try:
+        texts = collect_texts(directory)
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+
+    translate, cold, warm = bench(texts, options.repeat)
+    print('%d text nodes, %d characters'
+          % (len(texts), sum(len(text) for text in texts)))
+    print('%-28s %10s %8s' % ('', 'time [s]', 'speedup'))
+    for name, elapsed in [('unicode.translate', translate),
+                          ('TeXEscaper (empty memo)', cold),
+                          ('TeXEscaper (filled memo)', warm)]:
+        print('%-28s %10.4f %8.1f'
+              % (name, elapsed, translate / max(elapsed, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
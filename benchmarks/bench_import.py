@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the cost of loading the extension.
+
+Every sample runs a fresh interpreter which imports Sphinx (not measured) and
+then ``sphinx_clatex`` (measured), which is what a build with any builder
+does.  It is compared with also importing the LaTeX writer, which is what the
+extension used to import when it was loaded::
+
+    python -m benchmarks.bench_import [--repeat 20]
+"""
+
+from __future__ import print_function
+
+import sys
+import json
+import optparse
+import subprocess
+from os import path
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+# modules which only the clatex builder needs
+HEAVY = ['sphinx.writers.latex', 'sphinx.highlighting', 'pygments',
+         'sphinx_clatex.writer', 'sphinx_clatex.highlight',
+         'sphinx_clatex.compile']
+
+SAMPLE = '''
+import sys, time, json
+sys.path.insert(0, %(root)r)
+import sphinx.application
+before = set(sys.modules)
+start = time.time()
+%(imports)s
+elapsed = time.time() - start
+new = set(sys.modules) - before
+loaded = [name for name in %(heavy)r if name in new]
+print(json.dumps([elapsed, len(new), loaded]))
+'''
+
+CASES = [
+    ('extension', 'import sphinx_clatex'),
+    ('extension + writer', 'import sphinx_clatex\n'
+                           'import sphinx_clatex.writer'),
+]
+
+
+def sample(imports):
+    code = SAMPLE % {'root': ROOT, 'imports': imports, 'heavy': HEAVY}
+    output = subprocess.check_output([sys.executable, '-c', code])
+    return json.loads(output.decode('utf-8'))
+
+
+def main(argv=sys.argv[1:]):
+    parser = optparse.OptionParser(usage=__doc__.strip())
+    parser.add_option('--repeat', type='int', default=20)
+    options, args = parser.parse_args(argv)
+
+    print('%-20s %10s %10s %8s  %s' % ('case', 'min [s]', 'median [s]',
+                                        'modules', 'heavy modules loaded'))
+    for name, imports in CASES:
+        samples = [sample(imports) for i in range(options.repeat)]
+        times = sorted(elapsed for elapsed, modules, loaded in samples)
+        modules, loaded = samples[0][1], samples[0][2]
+        print('%-20s %10.4f %10.4f %8d  %s'
+              % (name, times[0], times[len(times) // 2], modules,
+                 ', '.join(loaded) or '-'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the lookup of target titles for references to distant
+documents (``LaTeXBuilder.assemble_doctree``).
+
+Compares the linear scan over ``latex_documents`` with
+:class:`sphinx_clatex.titles.TitleIndex` as the number of targets and of
+references grows::
+
+    python -m benchmarks.bench_titles [--targets 10,100,500] [--xrefs 1000,10000]
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+import random
+import optparse
+
+from sphinx_clatex.titles import TitleIndex
+
+
+def make_titles(ntargets):
+    return [('volume%d/part%d/' % (i % 17, i), 'Volume %d' % i)
+            for i in range(ntargets)]
+
+
+def make_docnames(titles, nxrefs, rng):
+    docnames = []
+    for i in range(nxrefs):
+        subdir = rng.choice(titles)[0]
+        # some references point outside of all the targets
+        if rng.random() < 0.1:
+            subdir = 'misc/'
+        docnames.append('%schapter%d' % (subdir, rng.randrange(50)))
+    return docnames
+
+
+def linear_scan(titles, docname):
+    for subdir, title in titles:
+        if docname.startswith(subdir):
+            return title
+    return None
+
+
+def bench(ntargets, nxrefs, rng):
+    titles = make_titles(ntargets)
+    docnames = make_docnames(titles, nxrefs, rng)
+
+    start = time.time()
+    expected = [linear_scan(titles, docname) for docname in docnames]
+    linear = time.time() - start
+
+    start = time.time()
+    index = TitleIndex(titles)
+    found = [index.lookup(docname) for docname in docnames]
+    indexed = time.time() - start
+
+    if found != expected:
+        raise AssertionError('TitleIndex and the linear scan differ')
+    return linear, indexed
+
+
+def main(argv=sys.argv[1:]):
+    parser = optparse.OptionParser(usage=__doc__.strip())
+    parser.add_option('--targets', default='10,100,500,2000')
+    parser.add_option('--xrefs', default='1000,10000,50000')
+    parser.add_option('--seed', type='int', default=0)
+    options, args = parser.parse_args(argv)
+    rng = random.Random(options.seed)
+
+    print('%8s %8s %12s %12s %8s' % ('targets', 'xrefs', 'linear [s]',
+                                      'index [s]', 'speedup'))
+    for ntargets in map(int, options.targets.split(',')):
+        for nxrefs in map(int, options.xrefs.split(',')):
+            linear, indexed = bench(ntargets, nxrefs, rng)
+            print('%8d %8d %12.4f %12.4f %8.1f'
+                  % (ntargets, nxrefs, linear, indexed,
+                     linear / max(indexed, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Generator of synthetic Sphinx projects for the clatex benchmarks.
+
+The project has a tree of documents (``--docs`` documents, each with at most
+``--fanout`` children, so the toctrees are nested), and every document
+contains sections, theorems, environments, aligned and colored text, math,
+code blocks, tables, footnotes and cross references::
+
+    python -m benchmarks.corpus DIRECTORY [--docs 200] [--fanout 4]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import random
+import optparse
+from os import path
+
+CONF = '''\
+# generated by benchmarks.corpus
+import sys
+sys.path.insert(0, %(root)r)
+
+extensions = ['sphinx_clatex']
+master_doc = 'index'
+project = u'clatex benchmark'
+latex_documents = [
+%(targets)s]
+clatex_documentclass = '\\\\documentclass{book}\\n'
+clatex_preamble = \'\'\'
+\\\\newtheorem{theorem}{Theorem}[chapter]
+\\\\newtheorem{definition}[theorem]{Definition}
+\\\\newtheorem{lemma}[theorem]{Lemma}
+\'\'\'
+'''
+
+THEOREM = '''\
+.. %(kind)s:: %(title)s
+   :name: %(label)s
+
+   Let :math:`x_{%(n)d} \\in \\mathbb{R}` and assume that
+   :textcolor:`<#FF0000> the sequence converges`.  Then
+
+   .. math::
+
+      \\sum_{k=0}^{%(n)d} x_k^2 \\leq %(n)d
+
+'''
+
+ENVIRONMENT = '''\
+.. environment:: remark
+   :title: Remark %(n)d
+
+   Some remark with *emphasis*, ``literal`` text and a footnote [#f%(n)d]_.
+
+.. [#f%(n)d] The footnote of remark %(n)d.
+
+.. align:: center
+
+   Centered paragraph number %(n)d.
+
+.. textcolor:: #00FF00
+
+   Green paragraph number %(n)d.
+
+.. endpar::
+
+'''
+
+CODE = '''\
+.. code-block:: python
+
+   def function_%(n)d(x):
+       """Docstring %(n)d"""
+       return [i * x for i in range(%(n)d) if i %% 3]
+
+'''
+
+TABLE = '''\
+.. list-table:: Table %(n)d
+
+   * - key
+     - value
+   * - a%(n)d
+     - :math:`a_{%(n)d}`
+   * - b%(n)d
+     - b
+
+'''
+
+PARAGRAPH = '''\
+Lorem ipsum dolor sit amet, consectetur adipiscing elit %(n)d, sed do eiusmod
+tempor incididunt ut labore et dolore magna aliqua -- with $ and %% and & and
+# special characters, see :ref:`%(ref)s`.
+
+'''
+
+
+def docname(index):
+    return 'index' if index == 0 else 'doc%04d' % index
+
+
+def children(index, ndocs, fanout):
+    first = index * fanout + 1
+    return [child for child in range(first, first + fanout) if child < ndocs]
+
+
+def document(index, ndocs, fanout, blocks, rng):
+    title = 'Document %d' % index
+    out = ['.. _%s:\n\n' % docname(index), title, '\n', '=' * len(title),
+           '\n\n']
+    kids = children(index, ndocs, fanout)
+    if kids:
+        out.append('.. toctree::\n\n')
+        out.extend('   %s\n' % docname(child) for child in kids)
+        out.append('\n')
+    for section in range(2):
+        heading = 'Section %d.%d' % (index, section)
+        out.extend([heading, '\n', '-' * len(heading), '\n\n'])
+        for block in range(blocks):
+            n = (index * 2 + section) * blocks + block
+            values = {
+                'n': n,
+                'kind': rng.choice(['theorem', 'definition', 'lemma']),
+                'title': 'Result %d' % n,
+                'label': 'thm-%d' % n,
+                'ref': docname(rng.randrange(ndocs)),
+            }
+            out.append(PARAGRAPH % values)
+            out.append(THEOREM % values)
+            out.append(ENVIRONMENT % values)
+            out.append(CODE % values)
+            out.append(TABLE % values)
+    return ''.join(out)
+
+
+def generate(directory, docs=200, fanout=4, blocks=3, targets=1, seed=0):
+    """
+    Write a project with ``docs`` documents to ``directory``; ``blocks`` is
+    the number of theorem/environment/code/table groups per section and
+    ``targets`` the number of ``latex_documents`` (the first is the whole
+    project, the others are subtrees).
+    """
+    rng = random.Random(seed)
+    if not path.isdir(directory):
+        os.makedirs(directory)
+    for index in range(docs):
+        with open(path.join(directory, docname(index) + '.rst'), 'w') as f:
+            f.write(document(index, docs, fanout, blocks, rng))
+    entries = ["    ('index', 'bench.tex', u'Benchmark', u'clatex', 'manual'),\n"]
+    for target in range(1, targets):
+        entries.append("    (%r, 'bench%d.tex', u'Volume %d', u'clatex', "
+                       "'manual'),\n" % (docname(target), target, target))
+    root = path.dirname(path.dirname(path.abspath(__file__)))
+    with open(path.join(directory, 'conf.py'), 'w') as f:
+        f.write(CONF % {'root': root, 'targets': ''.join(entries)})
+    return directory
+
+
+def main(argv=sys.argv[1:]):
+    parser = optparse.OptionParser(usage=__doc__.strip())
+    parser.add_option('--docs', type='int', default=200)
+    parser.add_option('--fanout', type='int', default=4)
+    parser.add_option('--blocks', type='int', default=3)
+    parser.add_option('--targets', type='int', default=1)
+    parser.add_option('--seed', type='int', default=0)
+    options, args = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error('the project directory is required')
+    generate(args[0], options.docs, options.fanout, options.blocks,
+             options.targets, options.seed)
+    print('generated %d documents in %s' % (options.docs, args[0]))
+
+
+if __name__ == '__main__':
+    main()
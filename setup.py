@@ -1,7 +1,12 @@
 #!/usr/bin/env python
 # -%- coding: utf-8 -%-
 
-from distutils.core import setup
+try:
+    from setuptools import setup
+    requirements = {'install_requires': ['Sphinx>=1.3']}
+except ImportError:
+    from distutils.core import setup
+    requirements = {'requires': ['Sphinx (>=1.3)']}
 
 setup(
     name='sphinx-latex',
@@ -11,4 +16,5 @@ setup(
     author_email='coot@riseup.net',
     url='https://www.github.com/coot/sphinx_latex',
     packages=['sphinx_clatex'],
+    **requirements
 )
@@ -15,31 +15,59 @@
 """
 
 import os
+import inspect
+import traceback
+import multiprocessing
 from os import path
+from functools import partial
+from multiprocessing.pool import ThreadPool
 
 from docutils import nodes
-from docutils.io import FileOutput
 from docutils.utils import new_document
-from docutils.frontend import OptionParser
 from docutils.parsers.rst import Directive
 
 from sphinx import package_dir
 from sphinx import addnodes
 from sphinx.util import texescape
 from sphinx.locale import _
+from sphinx.errors import SphinxError, ConfigError
 from sphinx.builders import Builder
 from sphinx.environment import NoUri
 from sphinx.util.nodes import inline_all_toctrees
-from sphinx.util.osutil import SEP, copyfile
+from sphinx.util.osutil import SEP
 from sphinx.util.console import bold, darkgreen
-from sphinx.ext.mathbase import math_role
-from sphinx.ext.mathbase import eq_role
-from sphinx.ext.mathbase import MathDirective
-from sphinx.ext.mathbase import number_equations
 
-from .writer import (CustomLaTeXWriter as LaTeXWriter,
-                           HEADER)
+from .templates import HEADER
 from .directives import setup as clatex_setup
+from .depends import (DependencyTracker, config_fingerprint,
+                      assembly_fingerprint, translation_fingerprint)
+from .doctrees import AssembledDoctreeCache, DoctreeCache, resolve_digest
+from .fragments import FragmentStore, make_backend
+from .manifest import WriteManifest, ManifestFileOutput, COPY_MODES
+from .titles import TitleIndex
+from .instrument import PhaseRecorder, count_nodes
+from .visitprofile import VisitorProfile
+
+# The LaTeX writer (and with it sphinx.writers.latex and Pygments) and the
+# compile driver are imported only when the builder runs: the extension is
+# also loaded by builds with other builders, which never need them.
+
+# Sphinx 1.3 (which the theorem numbering needs for env-merge-info) passes
+# the list of the documents already inlined to inline_all_toctrees
+inline_traversed = 'traversed' in inspect.getargspec(inline_all_toctrees)[0]
+
+# parallel writing relies on fork() to hand the builder over to the workers
+parallel_available = os.name == 'posix'
+
+# (builder, docwriter, docsettings, entries) of the running parallel write;
+# set just before the worker pool is forked
+_parallel_state = None
+
+
+def _write_target_process(index):
+    builder, docwriter, docsettings, entries = _parallel_state
+    return builder.write_target_collected(entries[index], docwriter,
+                                          docsettings)
 
 
 class LaTeXBuilder(Builder):
@@ -50,15 +78,69 @@ class LaTeXBuilder(Builder):
     format = 'latex'
     supported_image_types = ['application/pdf', 'image/png',
                              'image/gif', 'image/jpeg']
-    WriterClass = LaTeXWriter
+    # None stands for sphinx_clatex.writer.CustomLaTeXWriter, see
+    # get_writer_class
+    WriterClass = None
 
     def init(self):
+        if self.config.clatex_copy_mode not in COPY_MODES:
+            raise ConfigError('clatex_copy_mode must be one of %s, not %r'
+                              % (', '.join(map(repr, COPY_MODES)),
+                                 self.config.clatex_copy_mode))
         self.docnames = []
         self.document_data = []
+        self.deps = DependencyTracker(self.outdir, self.srcdir)
+        self.manifest = WriteManifest(self.outdir)
+        self.phases = PhaseRecorder(self.app, self.config.clatex_instrument,
+                                    path.join(self.outdir, '_clatex_phases'))
+        self.current_target = None
+        self.written_targets = []
+        # set in the worker processes of clatex_parallel_write
+        self.parallel_worker = False
+        if self.config.clatex_profile_visitors:
+            self.visitor_profile = VisitorProfile()
+        else:
+            self.visitor_profile = None
+        if self.config.clatex_highlight_cache_size:
+            from .highlight import HighlightCache
+            self.highlight_cache = HighlightCache(
+                path.join(self.doctreedir, 'clatex-highlight'),
+                self.config.clatex_highlight_cache_size)
+        else:
+            self.highlight_cache = None
+        if self.config.clatex_doctree_cache_size:
+            self.doctree_cache = DoctreeCache(
+                self.env, self.config.clatex_doctree_cache_size)
+        else:
+            self.doctree_cache = None
+        if self.config.clatex_fragment_cache:
+            from .highlight import VERSIONS
+            self.fragment_store = FragmentStore(
+                translation_fingerprint(self.config, *VERSIONS),
+                make_backend(self, self.config.clatex_fragment_cache_backend))
+        elif self.config.clatex_share_fragments:
+            self.fragment_store = FragmentStore()
+        else:
+            self.fragment_store = None
+        if self.config.clatex_assembled_cache:
+            self.assembled_cache = AssembledDoctreeCache(
+                path.join(self.doctreedir, 'clatex-assembled'),
+                self.doctreedir)
+        else:
+            self.assembled_cache = None
         texescape.init()
 
     def get_outdated_docs(self):
-        return 'all documents' # for now
+        if not self.deps.records:
+            return 'all documents'
+        outdated = set()
+        for entry in self.config.latex_documents:
+            targetname = entry[1]
+            if self.deps.outdated(targetname, self.env,
+                                  config_fingerprint(self.config, entry)):
+                outdated.add(entry[0])
+                outdated.update(self.deps.docnames(targetname))
+        return sorted(outdated)
 
     def get_target_uri(self, docname, typ=None):
         if docname not in self.docnames:
@@ -71,6 +153,7 @@ class LaTeXBuilder(Builder):
         return self.get_target_uri(to, typ)
 
     def init_document_data(self):
+        self.document_data = []
         preliminary_document_data = map(list, self.config.latex_documents)
         if not preliminary_document_data:
             self.warn('no "latex_documents" config value found; no documents '
@@ -88,41 +171,299 @@ class LaTeXBuilder(Builder):
             if docname.endswith(SEP+'index'):
                 docname = docname[:-5]
             self.titles.append((docname, entry[2]))
+        self.title_index = TitleIndex(self.titles)
+
+    def get_writer_class(self):
+        if self.WriterClass is None:
+            from .writer import CustomLaTeXWriter
+            return CustomLaTeXWriter
+        return self.WriterClass
 
-    def write(self, *ignored):
-        docwriter = self.WriterClass(self)
+    def write(self, build_docnames=None, updated_docnames=None,
+              method='update'):
+        from docutils.frontend import OptionParser
+        docwriter = self.get_writer_class()(self)
         docsettings = OptionParser(
             defaults=self.env.settings,
             components=(docwriter,)).get_default_values()
 
         self.init_document_data()
+        self.reset_counters()
 
+        # a target is written only if one of its inputs changed since the
+        # last build (or with sphinx-build -a); documents which were not read
+        # again can be updated too, e.g. by new theorem numbers
+        updated_docnames = set(updated_docnames or ())
+        entries = []
         for entry in self.document_data:
-            docname, targetname, title, author, docclass = entry[:5]
-            toctree_only = False
-            if len(entry) > 5:
-                toctree_only = entry[5]
-            destination = FileOutput(
-                destination_path=path.join(self.outdir, targetname),
-                encoding='utf-8')
-            self.info("processing " + targetname + "... ", nonl=1)
-            doctree = self.assemble_doctree(docname, toctree_only,
-                appendices=((docclass != 'howto') and
-                            self.config.latex_appendices or []))
+            if method != 'all':
+                reason = self.deps.outdated(
+                    entry[1], self.env, config_fingerprint(self.config, entry))
+                if reason is None and \
+                        updated_docnames.intersection(
+                            self.deps.docnames(entry[1])):
+                    reason = 'documents updated'
+                if reason is None:
+                    self.info(entry[1] + ": up to date")
+                    continue
+            entries.append(entry)
+        if entries and self.fragment_store is not None:
+            self.fragment_store.new_build()
+
+        if self.assembled_cache is not None:
+            # resolved references depend on the labels, objects and titles
+            # of all the documents
+            self.resolve_digest = resolve_digest(self.env)
+        # sphinx-build -a assembles every target again (and caches it)
+        self.reuse_assembled = method != 'all'
+
+        if self.doctree_cache is not None:
+            self.doctree_cache.install()
+        try:
+            nproc = self.config.clatex_parallel_write
+            if nproc > 1 and len(entries) > 1 and parallel_available:
+                self.write_parallel(entries, docwriter, docsettings, nproc)
+            else:
+                for entry in entries:
+                    self.write_target(entry, docwriter, docsettings)
+        finally:
+            if self.doctree_cache is not None:
+                self.doctree_cache.uninstall()
+            self.deps.dump()
+            self.manifest.dump()
+
+    def write_target(self, entry, docwriter, docsettings):
+        docname, targetname, title, author, docclass = entry[:5]
+        toctree_only = False
+        if len(entry) > 5:
+            toctree_only = entry[5]
+        # forget the old record, it is stale if writing fails
+        self.deps.records.pop(targetname, None)
+        self.current_target = targetname
+        phase = partial(self.phases.phase, targetname)
+        destination = ManifestFileOutput(
+            self.manifest,
+            phase=partial(phase, 'write'),
+            destination_path=path.join(self.outdir, targetname),
+            encoding='utf-8')
+        self.info("processing " + targetname + "... ", nonl=1)
+        with phase('assemble') as record:
+            doctree = None
+            if self.assembled_cache is not None and self.reuse_assembled:
+                doctree, docnames = self.assembled_cache.load(
+                    targetname,
+                    lambda docnames: self.assembly_key(entry, docnames))
+                if doctree is not None:
+                    self.docnames = set(docnames)
+                    self.info("(using the cached doctree) ", nonl=1)
+            if doctree is None:
+                doctree = self.assemble_doctree(docname, toctree_only,
+                    appendices=((docclass != 'howto') and
+                                self.config.latex_appendices or []))
+                if self.assembled_cache is not None:
+                    self.assembled_cache.store(
+                        targetname, self.assembly_key(entry, self.docnames),
+                        self.docnames, doctree)
+            if self.phases.enabled:
+                record['nodes'] = count_nodes(doctree)
+        with phase('post_process_images'):
             self.post_process_images(doctree)
-            self.info("writing... ", nonl=1)
-            doctree.settings = docsettings
-            doctree.settings.author = author
-            doctree.settings.title = title
-            doctree.settings.docname = docname
-            doctree.settings.docclass = docclass
-            docwriter.write(doctree, destination)
-            self.info("done")
+        if self.highlight_cache is not None and not self.parallel_worker \
+                and self.config.clatex_highlight_workers > 1:
+            with phase('prehighlight') as record:
+                record['blocks'] = self.prehighlight(doctree)
+        self.info("writing... ", nonl=1)
+        doctree.settings = docsettings
+        doctree.settings.author = author
+        doctree.settings.title = title
+        doctree.settings.docname = docname
+        doctree.settings.docclass = docclass
+        doctree.settings.targetname = targetname
+        with phase('translate') as record:
+            if self.config.clatex_stream_output:
+                stream = self.manifest.open_stream(
+                    path.join(self.outdir, targetname))
+                try:
+                    docwriter.write_stream(
+                        doctree, stream, self.config.clatex_stream_chunk_size)
+                except:
+                    stream.discard()
+                    raise
+                stream.close()
+                record['bytes'] = stream.size
+            else:
+                docwriter.write(doctree, destination)
+        images = [node['uri'] for node in doctree.traverse(nodes.image)
+                  if node['uri'] in self.images]
+        self.deps.record(targetname, self.env, self.docnames, images,
+                         config_fingerprint(self.config, entry))
+        self.current_target = None
+        self.written_targets.append(targetname)
+        if not self.phases.deferred:
+            self.phases.write_report(targetname)
+        self.info("done")
+
+    def prehighlight(self, doctree):
+        """
+        Highlight the literal blocks of ``doctree`` in parallel, before it is
+        translated (clatex_highlight_workers).
+        """
+        from .highlight import CachingPygmentsBridge, prehighlight
+        bridge = CachingPygmentsBridge(self.highlight_cache, 'latex',
+                                       self.config.pygments_style,
+                                       self.config.trim_doctest_flags)
+        return prehighlight(bridge, doctree, self,
+                            self.config.clatex_highlight_workers)
+
+    def assembly_key(self, entry, docnames):
+        """
+        The key of the assembled doctree of the target ``entry`` built from
+        ``docnames``.
+        """
+        docnames = set(docnames)
+        numbers = getattr(self.env, 'clatex_theorem_numbers', {})
+        index = getattr(self.env, 'clatex_theorem_index', {})
+        refs = getattr(self.env, 'clatex_theorem_refs', {})
+        labels = set()
+        for docname in docnames:
+            labels.update(refs.get(docname, ()))
+        return self.assembled_cache.key(
+            docnames,
+            assembly_fingerprint(self.config, entry),
+            self.resolve_digest,
+            sorted(item for item in numbers.iteritems()
+                   if item[0][0] in docnames),
+            sorted((label, index.get(label)) for label in labels))
+
+    def write_target_collected(self, entry, docwriter, docsettings):
+        """
+        Run :meth:`write_target` in a worker process.
+
+        Messages are collected instead of printed, so that the parent can
+        replay them target by target; exceptions are returned as a formatted
+        traceback.  Everything returned has to be picklable.
+        """
+        messages = []
+        def collect(kind):
+            def collector(*args, **kwargs):
+                messages.append((kind, args, kwargs))
+            return collector
+        self.info = collect('info')
+        self.warn = collect('warn')
+        self.env.set_warnfunc(collect('envwarn'))
+        self.phases.deferred = True
+        self.parallel_worker = True
+        self.images = {}
+        self.reset_counters()
+        error = None
+        try:
+            self.write_target(entry, docwriter, docsettings)
+        except Exception:
+            error = traceback.format_exc()
+        targetname = entry[1]
+        return {
+            'targetname': targetname,
+            'messages': messages,
+            'images': self.images,
+            'record': self.deps.records.get(targetname),
+            'manifest': self.manifest.changes(),
+            'phases': self.phases.take(targetname),
+            'highlight_cache': self.highlight_cache and
+                (self.highlight_cache.hits, self.highlight_cache.misses),
+            'assembled_cache': self.assembled_cache and
+                (self.assembled_cache.hits, self.assembled_cache.misses),
+            'fragment_store': self.fragment_store and
+                self.fragment_store.counters(),
+            'doctree_cache': self.doctree_cache and
+                self.doctree_cache.counters(),
+            'visitor_profile': self.visitor_profile and
+                self.visitor_profile.state(),
+            'error': error,
+        }
+
+    def reset_counters(self):
+        """
+        Reset the counters and phase records reported by :meth:`finish`:
+        before every build (a builder kept by the daemon runs many) and in
+        the worker processes, which send them to the parent.
+        """
+        self.manifest.reset()
+        self.phases.reset()
+        self.written_targets = []
+        if self.highlight_cache is not None:
+            self.highlight_cache.hits = self.highlight_cache.misses = 0
+        if self.assembled_cache is not None:
+            self.assembled_cache.hits = self.assembled_cache.misses = 0
+        if self.visitor_profile is not None:
+            self.visitor_profile = VisitorProfile()
+        if self.doctree_cache is not None:
+            self.doctree_cache.reset_counters()
+        if self.fragment_store is not None:
+            self.fragment_store.reset_counters()
+
+    def write_parallel(self, entries, docwriter, docsettings, nproc):
+        global _parallel_state
+        _parallel_state = (self, docwriter, docsettings, entries)
+        pool = multiprocessing.Pool(min(nproc, len(entries)))
+        failed = []
+        try:
+            results = pool.imap(_write_target_process, range(len(entries)))
+            for result in results:
+                targetname = result['targetname']
+                self.merge_target_result(result)
+                if result['error'] is not None:
+                    failed.append(targetname)
+                    self.info()
+                    self.warn('error while writing %s:\n%s'
+                              % (targetname, result['error']))
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            _parallel_state = None
+        if failed:
+            raise SphinxError('could not write LaTeX target(s): %s'
+                              % ', '.join(failed))
+
+    def merge_target_result(self, result):
+        """Replay the messages and merge the state of a worker process."""
+        for kind, args, kwargs in result['messages']:
+            if kind == 'info':
+                self.info(*args, **kwargs)
+            elif kind == 'warn':
+                self.warn(*args, **kwargs)
+            else:
+                self.app.warn(*args, **kwargs)
+        self.images.update(result['images'])
+        self.manifest.merge(result['manifest'])
+        self.phases.replay(result['phases'])
+        self.phases.write_report(result['targetname'])
+        if result['highlight_cache']:
+            hits, misses = result['highlight_cache']
+            self.highlight_cache.hits += hits
+            self.highlight_cache.misses += misses
+        if result['assembled_cache']:
+            hits, misses = result['assembled_cache']
+            self.assembled_cache.hits += hits
+            self.assembled_cache.misses += misses
+        if result['fragment_store']:
+            self.fragment_store.merge_counters(result['fragment_store'])
+        if result['doctree_cache']:
+            self.doctree_cache.merge_counters(result['doctree_cache'])
+        if result['visitor_profile']:
+            self.visitor_profile.merge(result['visitor_profile'])
+        if result['error'] is None:
+            self.deps.records[result['targetname']] = result['record']
+            self.written_targets.append(result['targetname'])
 
     def assemble_doctree(self, indexfile, toctree_only, appendices):
+        phase = partial(self.phases.phase, self.current_target)
         self.docnames = set([indexfile] + appendices)
         self.info(darkgreen(indexfile) + " ", nonl=1)
-        tree = self.env.get_doctree(indexfile)
+        with phase('load_doctree'):
+            tree = self.env.get_doctree(indexfile)
         tree['docname'] = indexfile
         if toctree_only:
             # extract toctree nodes from the tree and put them in a
@@ -135,91 +476,213 @@ class LaTeXBuilder(Builder):
             for node in tree.traverse(addnodes.toctree):
                 new_sect += node
             tree = new_tree
-        largetree = inline_all_toctrees(self, self.docnames, indexfile, tree,
-                                        darkgreen)
+        with phase('inline_toctrees'):
+            if inline_traversed:
+                largetree = inline_all_toctrees(self, self.docnames,
+                                                indexfile, tree, darkgreen,
+                                                [indexfile])
+            else:
+                largetree = inline_all_toctrees(self, self.docnames,
+                                                indexfile, tree, darkgreen)
         largetree['docname'] = indexfile
-        for docname in appendices:
-            appendix = self.env.get_doctree(docname)
-            appendix['docname'] = docname
-            largetree.append(appendix)
+        with phase('load_appendices'):
+            for docname in appendices:
+                appendix = self.env.get_doctree(docname)
+                appendix['docname'] = docname
+                largetree.append(appendix)
         self.info()
         self.info("resolving references...")
-        self.env.resolve_references(largetree, indexfile, self)
+        with phase('resolve_references'):
+            self.env.resolve_references(largetree, indexfile, self)
         # resolve :ref:s to distant tex files -- we can't add a cross-reference,
         # but append the document name
-        for pendingnode in largetree.traverse(addnodes.pending_xref):
-            docname = pendingnode['refdocname']
-            sectname = pendingnode['refsectname']
-            newnodes = [nodes.emphasis(sectname, sectname)]
-            for subdir, title in self.titles:
-                if docname.startswith(subdir):
-                    newnodes.append(nodes.Text(_(' (in '), _(' (in ')))
+        with phase('distant_references'):
+            in_ = _(' (in ')
+            for pendingnode in largetree.traverse(addnodes.pending_xref):
+                docname = pendingnode['refdocname']
+                sectname = pendingnode['refsectname']
+                newnodes = [nodes.emphasis(sectname, sectname)]
+                title = self.title_index.lookup(docname)
+                if title is not None:
+                    newnodes.append(nodes.Text(in_, in_))
                     newnodes.append(nodes.emphasis(title, title))
                     newnodes.append(nodes.Text(')', ')'))
-                    break
-            else:
-                pass
-            pendingnode.replace_self(newnodes)
+                pendingnode.replace_self(newnodes)
         return largetree
 
+    def copy_files(self, files):
+        """
+        Copy the ``(source, destination)`` pairs ``files`` into the output
+        directory using ``clatex_copy_workers`` threads.
+        """
+        mode = self.config.clatex_copy_mode
+        workers = min(self.config.clatex_copy_workers, len(files))
+        if workers > 1:
+            self.info(' %d files' % len(files), nonl=1)
+            pool = ThreadPool(workers)
+            try:
+                pool.map(lambda pair:
+                             self.manifest.copy_file(pair[0], pair[1], mode),
+                         files)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for src, dest in files:
+                self.info(' '+path.basename(src), nonl=1)
+                self.manifest.copy_file(src, dest, mode)
+
     def finish(self):
+        phase = partial(self.phases.phase, None)
+        timings = []
+
         # copy image files
         if self.images:
             self.info(bold('copying images...'), nonl=1)
-            for src, dest in self.images.iteritems():
-                self.info(' '+src, nonl=1)
-                copyfile(path.join(self.srcdir, src),
-                         path.join(self.outdir, dest))
+            with phase('copy_images') as record:
+                self.copy_files(
+                    [(path.join(self.srcdir, src),
+                      path.join(self.outdir, dest))
+                     for src, dest in self.images.iteritems()])
+            timings.append(('images', record['wall']))
             self.info()
 
         # copy additional files
         if self.config.latex_additional_files:
             self.info(bold('copying additional files...'), nonl=1)
-            for filename in self.config.latex_additional_files:
-                self.info(' '+filename, nonl=1)
-                copyfile(path.join(self.confdir, filename),
-                         path.join(self.outdir, path.basename(filename)))
+            with phase('copy_additional_files') as record:
+                self.copy_files(
+                    [(path.join(self.confdir, filename),
+                      path.join(self.outdir, path.basename(filename)))
+                     for filename in self.config.latex_additional_files])
+            timings.append(('additional files', record['wall']))
             self.info()
 
         # the logo is handled differently
         if self.config.latex_logo:
-            logobase = path.basename(self.config.latex_logo)
-            copyfile(path.join(self.confdir, self.config.latex_logo),
-                     path.join(self.outdir, logobase))
+            with phase('copy_logo') as record:
+                logobase = path.basename(self.config.latex_logo)
+                self.manifest.copy_file(
+                    path.join(self.confdir, self.config.latex_logo),
+                    path.join(self.outdir, logobase),
+                    self.config.clatex_copy_mode)
+            timings.append(('logo', record['wall']))
 
         self.info(bold('copying TeX support files... '), nonl=True)
         staticdirname = path.join(package_dir, 'texinputs')
-        for filename in os.listdir(staticdirname):
-            if not filename.startswith('.'):
-                copyfile(path.join(staticdirname, filename),
-                         path.join(self.outdir, filename))
-        self.info('done')
+        with phase('copy_support_files') as record:
+            self.copy_files(
+                [(path.join(staticdirname, filename),
+                  path.join(self.outdir, filename))
+                 for filename in os.listdir(staticdirname)
+                 if not filename.startswith('.')])
+        timings.append(('TeX support files', record['wall']))
+        self.info(' done')
+
+        self.manifest.dump()
+        self.info(bold('%d files written, %d unchanged files skipped'
+                       % (self.manifest.written, self.manifest.skipped)))
+        self.info('copying took: ' + ', '.join(
+            '%s %.2fs' % timing for timing in timings))
+
+        if self.highlight_cache is not None:
+            self.highlight_cache.prune()
+            self.info('highlighting cache: %d hits, %d misses'
+                      % (self.highlight_cache.hits,
+                         self.highlight_cache.misses))
+        if self.assembled_cache is not None:
+            self.info('assembled doctree cache: %d hits, %d misses'
+                      % (self.assembled_cache.hits,
+                         self.assembled_cache.misses))
+        if self.fragment_store is not None:
+            self.info('shared documents: %d translations reused '
+                      '(%d from the fragment cache), %d made'
+                      % self.fragment_store.counters())
+        if self.doctree_cache is not None:
+            self.info('doctree cache: %d hits, %d misses, '
+                      'unpickling took %.2fs, copying %.2fs'
+                      % self.doctree_cache.counters())
+
+        if self.visitor_profile is not None:
+            self.info(bold('translator profile:'))
+            for line in self.visitor_profile.table(
+                    self.config.clatex_profile_visitors):
+                self.info(line)
+
+        if self.config.clatex_compile:
+            self.info(bold('compiling PDF files...'))
+            from .compile import CompileDriver
+            with phase('compile'):
+                failed = CompileDriver(self).run()
+        else:
+            failed = []
+
+        self.phases.write_report(None)
+        if failed:
+            raise SphinxError('could not compile LaTeX target(s): %s'
+                              % ', '.join(failed))
 
 
 def setup(app, add_builder=True):
-    app.add_config_value('clatex_documentclass', '\\documentclass{book}\n', 'env')
-    app.add_config_value('clatex_preamble', '', 'env')
-    app.add_config_value('clatex_use_chapters', True, 'env')
-    app.add_config_value('clatex_begin_doc', '', 'env')
-    app.add_config_value('clatex_end_doc', '', 'env')
-    app.add_config_value('clatex_highlighter', True, 'env')
-    app.add_config_value('clatex_hyperref_args', '', 'env')
-    app.add_config_value('clatex_makeidx', False, 'env')
-    app.add_config_value('clatex_header', HEADER, 'env')
+    # env-merge-info (the theorem numbering) and the parallel-safe metadata
+    app.require_sphinx('1.3')
+
+    # No clatex option is used while the sources are read, so none of them
+    # invalidates the environment: the dependency records of the builder
+    # (see depends.py) decide which targets are written again when an option
+    # changes, and the caches of assembled doctrees and translated documents
+    # are keyed by just the options they depend on.
+    app.add_config_value('clatex_documentclass', '\\documentclass{book}\n', '')
+    app.add_config_value('clatex_preamble', '', '')
+    app.add_config_value('clatex_use_chapters', True, '')
+    app.add_config_value('clatex_begin_doc', '', '')
+    app.add_config_value('clatex_end_doc', '', '')
+    app.add_config_value('clatex_highlighter', True, '')
+    app.add_config_value('clatex_hyperref_args', '', '')
+    app.add_config_value('clatex_makeidx', False, '')
+    app.add_config_value('clatex_parallel_write', 0, '')
+    app.add_config_value('clatex_copy_workers', 1, '')
+    app.add_config_value('clatex_copy_mode', 'copy', '')
+    app.add_config_value('clatex_highlight_cache_size', 0, '')
+    app.add_config_value('clatex_highlight_workers', 1, '')
+    app.add_config_value('clatex_stream_output', False, '')
+    app.add_config_value('clatex_stream_chunk_size', 1024 * 1024, '')
+    app.add_config_value('clatex_assembled_cache', False, '')
+    app.add_config_value('clatex_doctree_cache_size', 0, '')
+    app.add_config_value('clatex_split_chapters', False, '')
+    app.add_config_value('clatex_includeonly', False, '')
+    app.add_config_value('clatex_share_fragments', False, '')
+    app.add_config_value('clatex_fragment_cache', False, '')
+    app.add_config_value('clatex_fragment_cache_backend', 'local', '')
+    app.add_config_value('clatex_compile', False, '')
+    app.add_config_value('clatex_compile_command',
+                         ['pdflatex', '-interaction=nonstopmode',
+                          '-halt-on-error'], '')
+    app.add_config_value('clatex_makeindex_command', ['makeindex'], '')
+    app.add_config_value('clatex_compile_workers', 1, '')
+    app.add_config_value('clatex_compile_max_passes', 5, '')
+    app.add_config_value('clatex_instrument', False, '')
+    app.add_config_value('clatex_profile_visitors', 0, '')
+    app.add_event('clatex-phase')
+    app.add_config_value('clatex_header', HEADER, '')
     app.add_config_value(
         'clatex_sectionnames',
         ["part", "chapter", "section", "subsection", "subsubsection",
          "paragraph", "subparagraph"],
-        'env',
+        '',
     )
     # clatex_makeidx can be a boolean or a string ('\usepackage{makeidx}\n\makeindex')
 
     if add_builder:
         app.add_builder(LaTeXBuilder)
 
+    # the math roles and directive are needed by every builder, so mathbase
+    # is imported when the extension is set up (not when it is imported)
+    from sphinx.ext.mathbase import (math_role, eq_role, MathDirective,
+                                     number_equations)
     app.add_role('math', math_role)
     app.add_role('eq', eq_role)
     app.add_directive('math', MathDirective)
     app.connect('doctree-resolved', number_equations)
 
-    clatex_setup(app)
+    return clatex_setup(app)
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Compile the LaTeX targets to PDF.
+
+Every target is compiled in its own work directory inside the output
+directory, which is kept between builds, so the auxiliary files of the
+previous build are reused.  The output directory is put on ``TEXINPUTS``, so
+the engine finds the sources, chapters, images and style files there.
+
+Instead of running the engine a fixed number of times, it is run until the
+auxiliary files (``.aux``, ``.toc``, ``.idx``, ...) stop changing.
+``makeindex`` is run only if the ``.idx`` file changed since its last run.
+Targets are compiled in parallel by a pool of processes.
+
+The ``\\includeonly`` lists of ``clatex_includeonly`` are a draft mode for
+compiling by hand: the compile stage always typesets whole documents.  The
+work directory, which comes first on ``TEXINPUTS``, holds an empty
+``<target>-includeonly.tex``, which is read instead of the list.
+"""
+
+import os
+import shlex
+import shutil
+import subprocess
+import multiprocessing
+from os import path
+
+from .manifest import file_digest
+
+# auxiliary files whose content decides whether another pass is needed
+AUX_EXTENSIONS = ('.aux', '.toc', '.idx', '.lof', '.lot', '.out')
+
+# the .idx digest of the last makeindex run
+IDX_DIGEST = '.clatex-idx-digest'
+
+
+def split_command(command):
+    if isinstance(command, basestring):
+        return shlex.split(command)
+    return list(command)
+
+
+def aux_digests(workdir):
+    digests = {}
+    for filename in os.listdir(workdir):
+        if path.splitext(filename)[1] in AUX_EXTENSIONS:
+            digests[filename] = file_digest(path.join(workdir, filename))
+    return digests
+
+
+def run(command, workdir, env):
+    with open(os.devnull, 'rb') as devnull:
+        process = subprocess.Popen(command, cwd=workdir, env=env,
+                                   stdin=devnull, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+    return process.returncode, output
+
+
+def read_file(filename):
+    try:
+        with open(filename, 'rb') as f:
+            return f.read()
+    except IOError:
+        return None
+
+
+def compile_target(job):
+    """
+    Compile one target; ``job`` is a ``(texfile, workdir, options)`` tuple,
+    see :meth:`CompileDriver.jobs`.  Returns ``(texfile, passes, error)``,
+    where error is None or the tail of the output of the failed command.
+    """
+    texfile, workdir, options = job
+    outdir = path.dirname(texfile)
+    base = path.splitext(path.basename(texfile))[0]
+    if not path.isdir(workdir):
+        os.makedirs(workdir)
+    env = dict(os.environ)
+    for variable in ('TEXINPUTS', 'INDEXSTYLE'):
+        env[variable] = os.pathsep.join(
+            ['.', outdir, env.get(variable, '')])
+    # hides the \includeonly list of clatex_includeonly
+    with open(path.join(workdir, base + '-includeonly.tex'), 'wb') as f:
+        f.write('% the whole document is compiled\n')
+
+    idxfile = base + '.idx'
+    idx_digest_file = path.join(workdir, IDX_DIGEST)
+    digests = aux_digests(workdir)
+    passes = 0
+    while passes < options['max_passes']:
+        passes += 1
+        returncode, output = run(options['command'] + [texfile], workdir, env)
+        if returncode != 0:
+            return texfile, passes, output[-2000:]
+        new_digests = aux_digests(workdir)
+        rerun = new_digests != digests
+        digests = new_digests
+        if options['makeindex'] and idxfile in digests and \
+                read_file(idx_digest_file) != digests[idxfile]:
+            returncode, output = run(options['makeindex_command'] + [idxfile],
+                                     workdir, env)
+            if returncode != 0:
+                return texfile, passes, output[-2000:]
+            with open(idx_digest_file, 'wb') as f:
+                f.write(digests[idxfile])
+            # the new index has to be typeset
+            rerun = True
+        if not rerun:
+            break
+    pdffile = path.join(workdir, base + '.pdf')
+    if not path.isfile(pdffile):
+        return texfile, passes, 'no PDF file was written:\n' + output[-2000:]
+    shutil.copyfile(pdffile, path.join(outdir, base + '.pdf'))
+    return texfile, passes, None
+
+
+class CompileDriver(object):
+
+    def __init__(self, builder):
+        self.builder = builder
+        config = builder.config
+        self.workdir = path.join(builder.outdir, '_clatex_compile')
+        self.options = {
+            'command': split_command(config.clatex_compile_command),
+            'makeindex_command': split_command(config.clatex_makeindex_command),
+            'makeindex': bool(config.clatex_makeidx),
+            'max_passes': config.clatex_compile_max_passes,
+        }
+        self.workers = config.clatex_compile_workers
+
+    def jobs(self):
+        """The targets whose PDF is missing or older than the source."""
+        jobs = []
+        for entry in self.builder.config.latex_documents:
+            texfile = path.join(self.builder.outdir, entry[1])
+            base = path.splitext(entry[1])[0]
+            pdffile = path.join(self.builder.outdir, base + '.pdf')
+            if not path.isfile(texfile):
+                continue
+            if path.isfile(pdffile) and \
+                    os.stat(pdffile).st_mtime >= self.newest_source(texfile):
+                continue
+            jobs.append((texfile, path.join(self.workdir, base),
+                         self.options))
+        return jobs
+
+    def newest_source(self, texfile):
+        # with clatex_split_chapters the chapters of a target are separate
+        # files named after it
+        base = path.splitext(texfile)[0]
+        newest = os.stat(texfile).st_mtime
+        for filename in os.listdir(path.dirname(texfile)):
+            filename = path.join(path.dirname(texfile), filename)
+            if filename.startswith(base + '-') and filename.endswith('.tex'):
+                newest = max(newest, os.stat(filename).st_mtime)
+        return newest
+
+    def run(self):
+        """Compile the outdated targets, return the names of the failed ones."""
+        jobs = self.jobs()
+        if not jobs:
+            return []
+        if self.workers > 1 and len(jobs) > 1:
+            pool = multiprocessing.Pool(min(self.workers, len(jobs)))
+            try:
+                results = pool.imap(compile_target, jobs)
+                failed = self.report(results)
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        else:
+            failed = self.report(compile_target(job) for job in jobs)
+        return failed
+
+    def report(self, results):
+        failed = []
+        for texfile, passes, error in results:
+            name = path.basename(texfile)
+            if error is None:
+                self.builder.info('compiled %s (%d pass%s)'
+                                  % (name, passes, passes > 1 and 'es' or ''))
+            else:
+                failed.append(name)
+                self.builder.warn('compiling %s failed:\n%s'
+                                  % (name, error.decode('utf-8', 'replace')))
+        return failed
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Daemon which keeps the clatex builder running between edits::
+
+    python -m sphinx_clatex.daemon [-c CONFDIR] [-d DOCTREEDIR] [-i SECONDS] \\
+        SOURCEDIR OUTPUTDIR
+
+It builds the project once and then polls the source directory for changes.
+After every change it runs an update build with the same Sphinx application,
+so the environment, the doctrees kept by ``clatex_doctree_cache_size``, the
+translations kept by ``clatex_share_fragments`` and the rest of the builder
+state stay in memory; only the targets whose inputs changed are written.
+For every rebuild it reports the targets written, how long the build took
+and the latency from the last edit to the written ``.tex`` files.  A change
+of ``conf.py`` starts a new application.  Stop it with Ctrl-C.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import optparse
+from os import path
+
+from sphinx.application import Sphinx
+
+
+def snapshot(directory, ignore):
+    """The modification times of the files under ``directory``."""
+    mtimes = {}
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames[:] = [dirname for dirname in dirnames
+                       if not dirname.startswith('.') and
+                       path.join(dirpath, dirname) not in ignore]
+        for filename in filenames:
+            if filename.startswith('.'):
+                continue
+            filename = path.join(dirpath, filename)
+            try:
+                mtimes[filename] = os.stat(filename).st_mtime
+            except OSError:
+                pass
+    return mtimes
+
+
+def changed_files(old, new):
+    return sorted(filename for filename in set(old) | set(new)
+                  if old.get(filename) != new.get(filename))
+
+
+class Daemon(object):
+
+    def __init__(self, srcdir, confdir, outdir, doctreedir, interval=1.0,
+                 status=sys.stdout, warning=sys.stderr):
+        self.srcdir = path.abspath(srcdir)
+        self.confdir = path.abspath(confdir)
+        self.outdir = path.abspath(outdir)
+        self.doctreedir = path.abspath(doctreedir)
+        self.interval = interval
+        self.status = status
+        self.warning = warning
+        self.conffile = path.join(self.confdir, 'conf.py')
+        self.app = None
+
+    def start(self):
+        """Create the application and build the project."""
+        self.app = Sphinx(self.srcdir, self.confdir, self.outdir,
+                          self.doctreedir, 'clatex', status=self.status,
+                          warning=self.warning)
+        self.app.build()
+
+    def snapshot(self):
+        mtimes = snapshot(self.srcdir, (self.outdir, self.doctreedir))
+        if not self.conffile.startswith(self.srcdir + os.sep):
+            mtimes.update(snapshot(self.confdir,
+                                   (self.outdir, self.doctreedir)))
+        return mtimes
+
+    def rebuild(self, changed, edited):
+        """
+        Build after the files ``changed`` were modified, the last one at
+        ``edited``; return the report line.
+        """
+        start = time.time()
+        if self.conffile in changed:
+            self.start()
+        else:
+            # not reset by a build which finds nothing to write
+            self.app.builder.written_targets = []
+            self.app.build()
+        end = time.time()
+        written = getattr(self.app.builder, 'written_targets', [])
+        return ('%d changed file%s: %s written in %.2fs, %.2fs after the '
+                'last edit' % (len(changed), len(changed) != 1 and 's' or '',
+                               ', '.join(written) or 'nothing',
+                               end - start, end - edited))
+
+    def run(self):
+        self.start()
+        mtimes = self.snapshot()
+        print('watching %s' % self.srcdir, file=self.status)
+        while True:
+            time.sleep(self.interval)
+            new_mtimes = self.snapshot()
+            changed = changed_files(mtimes, new_mtimes)
+            if not changed:
+                continue
+            # saving in an editor may touch the files a few times
+            time.sleep(self.interval / 4)
+            new_mtimes = self.snapshot()
+            changed = changed_files(mtimes, new_mtimes)
+            mtimes = new_mtimes
+            edited = max([mtimes.get(filename, 0) for filename in changed])
+            try:
+                report = self.rebuild(changed, edited or time.time())
+            except Exception as err:
+                report = 'build failed: %s' % err
+            print(report, file=self.status)
+
+
+def main(argv=sys.argv[1:]):
+    parser = optparse.OptionParser(usage=__doc__.strip())
+    parser.add_option('-c', dest='confdir', default=None,
+                      help='directory of conf.py (the source directory)')
+    parser.add_option('-d', dest='doctreedir', default=None,
+                      help='doctree directory (OUTPUTDIR/.doctrees)')
+    parser.add_option('-i', dest='interval', type='float', default=1.0,
+                      help='seconds between polls of the source directory')
+    options, args = parser.parse_args(argv)
+    if len(args) != 2:
+        parser.error('the source and the output directory are required')
+    srcdir, outdir = args
+    daemon = Daemon(srcdir, options.confdir or srcdir, outdir,
+                    options.doctreedir or path.join(outdir, '.doctrees'),
+                    options.interval)
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
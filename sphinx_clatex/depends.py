@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Dependency records of the clatex builder.
+
+For every target listed in ``latex_documents`` the builder records which
+source documents (and when they were read), which images and which
+configuration values went into it.  On the next build a target is written
+only if one of its inputs has changed.
+"""
+
+import os
+import hashlib
+import cPickle as pickle
+from os import path
+
+# options which do not change the written files
+NON_OUTPUT_CONFIG = ('clatex_parallel_write', 'clatex_copy_workers',
+                     'clatex_copy_mode', 'clatex_highlight_cache_size',
+                     'clatex_stream_output', 'clatex_stream_chunk_size',
+                     'clatex_assembled_cache', 'clatex_compile',
+                     'clatex_compile_command', 'clatex_makeindex_command',
+                     'clatex_compile_workers', 'clatex_compile_max_passes',
+                     'clatex_instrument', 'clatex_profile_visitors',
+                     'clatex_doctree_cache_size', 'clatex_share_fragments',
+                     'clatex_fragment_cache', 'clatex_fragment_cache_backend',
+                     'clatex_highlight_workers')
+
+# sphinx options besides the latex_* ones (which are all taken, since the
+# inherited translator reads many of them: latex_show_urls,
+# latex_show_pagerefs, ...) that influence the output of the clatex builder
+OUTPUT_CONFIG = ('pygments_style', 'highlight_language', 'highlight_options',
+                 'trim_doctest_flags', 'language', 'today', 'today_fmt',
+                 'numfig', 'numfig_format')
+
+
+# options which influence the translation of a document (but not of the
+# whole target), see fragments.FragmentStore
+TRANSLATION_CONFIG = ('clatex_sectionnames', 'clatex_use_chapters',
+                      'latex_use_parts', 'latex_show_urls',
+                      'latex_show_pagerefs', 'pygments_style',
+                      'highlight_language', 'highlight_options',
+                      'trim_doctest_flags', 'language')
+
+
+# options used when the doctree of a target is assembled and its references
+# are resolved
+ASSEMBLY_CONFIG = ('master_doc', 'latex_documents', 'latex_appendices',
+                   'language', 'intersphinx_mapping')
+
+
+def fingerprint(config, entry, names):
+    values = [(name, getattr(config, name, None)) for name in sorted(names)]
+    return hashlib.md5(repr((list(entry), values))).hexdigest()
+
+
+def config_fingerprint(config, entry):
+    """
+    Return a hash of the configuration values used to write the target
+    described by ``entry`` (an item of ``latex_documents``).
+    """
+    names = [name for name in config.values
+             if name.startswith(('clatex_', 'latex_')) and
+             name not in NON_OUTPUT_CONFIG]
+    names.extend(OUTPUT_CONFIG)
+    return fingerprint(config, entry, names)
+
+
+def assembly_fingerprint(config, entry):
+    """
+    Return a hash of the configuration values used to assemble the doctree
+    of the target described by ``entry``.
+    """
+    return fingerprint(config, entry, ASSEMBLY_CONFIG)
+
+
+def translation_fingerprint(config, *versions):
+    """
+    Return a hash of the configuration values used to translate a document;
+    ``versions`` are any other values it depends on.
+    """
+    return fingerprint(config, versions, TRANSLATION_CONFIG)
+
+
+def mtime(filename):
+    try:
+        return os.stat(filename).st_mtime
+    except OSError:
+        return None
+
+
+class DependencyTracker(object):
+    """
+    Per target record of the inputs of the last successful write::
+
+        {targetname: {'docnames': {docname: read time},
+                      'images': {image: mtime},
+                      'config': fingerprint}}
+    """
+
+    filename = '.clatex-deps'
+
+    def __init__(self, outdir, srcdir):
+        self.outdir = outdir
+        self.srcdir = srcdir
+        self.records = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(path.join(self.outdir, self.filename), 'rb') as f:
+                self.records = pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            self.records = {}
+
+    def dump(self):
+        with open(path.join(self.outdir, self.filename), 'wb') as f:
+            pickle.dump(self.records, f, pickle.HIGHEST_PROTOCOL)
+
+    def record(self, targetname, env, docnames, images, fingerprint):
+        self.records[targetname] = {
+            'docnames': dict((docname, env.all_docs.get(docname))
+                             for docname in docnames),
+            'images': dict((image, mtime(path.join(self.srcdir, image)))
+                           for image in images),
+            'config': fingerprint,
+        }
+
+    def outdated(self, targetname, env, fingerprint):
+        """
+        Return the reason why the target has to be written again, or None if
+        it is up to date.
+        """
+        record = self.records.get(targetname)
+        if record is None:
+            return 'not built yet'
+        if not path.isfile(path.join(self.outdir, targetname)):
+            return 'output missing'
+        if record['config'] != fingerprint:
+            return 'configuration changed'
+        for docname, stamp in record['docnames'].iteritems():
+            if env.all_docs.get(docname) != stamp:
+                return 'document %s changed' % docname
+        for image, stamp in record['images'].iteritems():
+            if mtime(path.join(self.srcdir, image)) != stamp:
+                return 'image %s changed' % image
+        return None
+
+    def docnames(self, targetname):
+        record = self.records.get(targetname)
+        if record is None:
+            return []
+        return list(record['docnames'])
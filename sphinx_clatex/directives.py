@@ -20,10 +20,20 @@ a text, no other nodes, directives are recursive though)
 
 Puts '\n\n' in LaTeX and <br> in html.
 (There is no other way to end a paragraph between two environments)
+
+:thmref:`label` refers to the theorem with :name: label, e.g. Theorem 3.2,
+:thmref:`text <label>` uses text instead.
 """
 from docutils.parsers.rst import directives
 from docutils.parsers.rst import Directive
 from docutils import nodes
+from sphinx.environment import NoUri
+from sphinx.util.nodes import split_explicit_title
+
+from .numbering import (collect_theorems, purge_theorems, merge_theorems,
+                        number_theorems)
+# Counter used to be defined here
+from .numbering import Counter
 
 __all__ = [ 'newtheorem', 'EnvironmentDirective', 'AlignDirective', 'TextColorDirective', 'TheoremDirectiveFactory']
 
@@ -245,7 +255,8 @@ def depart_endpar_html(self, node):
     pass
 
 # TheoremDirectiveFactory:
-def TheoremDirectiveFactory(thmname, thmcaption, thmnode, counter=None):
+def TheoremDirectiveFactory(thmname, thmcaption, thmnode, counter=None,
+                            within=None):
     """\
     Function which returns a theorem class.
 
@@ -254,6 +265,8 @@ def TheoremDirectiveFactory(thmname, thmcaption, thmnode, counter=None):
     thmcaption      - caption name to use
     thmnode         - node to write to
     counter         - counter name, if None do not count
+    within          - sectioning unit which resets the counter (e.g.
+                      'chapter'), if None the counter is never reset
 
     thmname='theorem', thmcaption='Theorem' will produce a directive:
 
@@ -281,10 +294,6 @@ def TheoremDirectiveFactory(thmname, thmcaption, thmnode, counter=None):
     """
     class TheoremDirective(Directive):
 
-        def __init__(self, *args, **kwargs):
-            self.counter = Counter(counter)
-            super(self.__class__, self).__init__(*args, **kwargs)
-
         required_arguments = 0
         optional_arguments = 1
 
@@ -300,11 +309,13 @@ def TheoremDirectiveFactory(thmname, thmcaption, thmnode, counter=None):
 
         def run(self):
 
+            # the number is filled in by stamp_theorems() once all the
+            # documents are read and numbered
+            self.options['counter'] = ''
             if counter:
-                self.counter.stepcounter()
-                self.options['counter'] = self.counter.value
-            else:
-                self.options['counter'] = ''
+                self.options['thmcounter'] = counter
+                if within:
+                    self.options['thmwithin'] = within
 
             self.options['thmname'] = thmname
             self.options['thmcaption'] = thmcaption
@@ -324,6 +335,10 @@ def visit_theorem_latex(self, node):
         self.body.append('\n\\begin{%(thmname)s}[{%(thmtitle)s}]' % node)
     else:
         self.body.append('\n\\begin{%(thmname)s}' % node)
+    if node['ids'] and node['names']:
+        # the target of thmref
+        self.body.append('\\label{%s}' % self.idescape(
+            '%s:%s' % (self.curfilestack[-1], node['ids'][0])))
 
 def depart_theorem_latex(self, node):
     self.body.append('\\end{%(thmname)s}' % node)
@@ -355,68 +370,110 @@ def depart_theorem_html(self, node):
     self.body.append('</div>')
     self.body.append('</div>')
 
-class Counter(object):
-    """\
-    Base class for counters.  There is only one instance for a given name.
-
-        >>> c=Counter('counter')
-        >>> d=Counter('counter')
-        >>> c id d
-        True
+class TheoremNode(nodes.Element):
+    pass
 
-    This is done using __new__ method.
+def stamp_theorems(app, doctree, docname):
+    """\
+    Fill in the theorem numbers assigned by numbering.number_theorems()
+    (connected to 'doctree-resolved').
     """
+    numbers = getattr(app.env, 'clatex_theorem_numbers', {})
+    for node in doctree.traverse(TheoremNode):
+        if 'thmcounter' in node:
+            node['counter'] = numbers.get(
+                (node['thmdocname'], node['thmindex']), '')
+
+# thmref role:
+class theorem_reference(nodes.Inline, nodes.TextElement):
+    pass
 
-    registered_counters = {}
-
-    def __new__(cls, name, value=0, within=None):
-        if name in cls.registered_counters:
-            instance = cls.registered_counters[name]
-            instance._init = False
-            return instance
+def thmref_role(name, rawtext, text, lineno, inliner, options={}, content=[]):
+    """\
+    :thmref:`label` or :thmref:`text <label>`, where label is the :name: of
+    a theorem.  Without text it is written as the caption and the number of
+    the theorem: Theorem 3.2.
+    """
+    has_title, title, label = split_explicit_title(text)
+    node = theorem_reference(rawtext)
+    node['thmreflabel'] = nodes.fully_normalize_name(label)
+    if has_title:
+        node['thmreftitle'] = title
+    return [node], []
+
+def resolve_theorem_references(app, doctree, docname):
+    """\
+    Look the labels of the thmref roles up in the index built by
+    numbering.theorem_index() (connected to 'doctree-resolved').
+    """
+    index = getattr(app.env, 'clatex_theorem_index', {})
+    for node in doctree.traverse(theorem_reference):
+        found = index.get(node['thmreflabel'])
+        if found is None:
+            app.env.warn(docname, 'undefined theorem label: %s'
+                         % node['thmreflabel'], node.line)
+            title = node.get('thmreftitle', node['thmreflabel'])
+            node.replace_self(nodes.emphasis(title, title))
+            continue
+        caption, number, refdocname, refid = found
+        node['thmcaption'] = caption
+        node['thmnumber'] = number
+        node['refdocname'] = refdocname
+        node['refid'] = refid
+        try:
+            node['refuri'] = '%s#%s' % (
+                app.builder.get_relative_uri(docname, refdocname), refid)
+        except NoUri:
+            pass
+        if 'thmreftitle' in node:
+            text = node['thmreftitle']
         else:
-            instance = super(Counter, cls).__new__(cls, name, value, within)
-            instance._init = True
-            return instance
-
-    def __init__(self, name, value=0, within=None):
-        if not self._init:
-            # __init__ once
-            return
-        self.name = name
-        self.value = value
+            text = ('%s %s' % (caption, number)).strip()
+        node.append(nodes.Text(text))
 
-        self.register()
-
-    def register(self):
-        Counter.registered_counters[self.name] = self
-
-    def stepcounter(self):
-        self.value += 1
-
-    def addtocounter(self, value=1):
-        self.value += value
-
-    def setcounter(self, value):
-        self.value = value
-
-    def __str__(self):
-        return str(self.value)
+def visit_theorem_reference_html(self, node):
+    if 'refuri' in node:
+        self.body.append('<a class="reference internal thmref" href="%s">'
+                         % self.attval(node['refuri']))
+    else:
+        self.body.append('<span class="thmref">')
+
+def depart_theorem_reference_html(self, node):
+    self.body.append('refuri' in node and '</a>' or '</span>')
+
+def visit_theorem_reference_latex(self, node):
+    if 'refdocname' not in node or \
+            node['refdocname'] not in self.builder.docnames:
+        # not in this document: the text with the number
+        return
+    label = self.idescape('%s:%s' % (node['refdocname'], node['refid']))
+    if 'thmreftitle' in node:
+        self.body.append('\\hyperref[%s]{' % label)
+        self.context.append('}')
+    else:
+        # LaTeX numbers the theorem: write the caption and \ref
+        self.body.append('\\hyperref[%s]{%s~\\ref*{%s}}'
+                         % (label, self.encode(node['thmcaption']), label))
+        raise nodes.SkipNode
 
-    def __unicode__(self):
-        return str(self.value)
-
-class TheoremNode(nodes.Element):
-    pass
+def depart_theorem_reference_latex(self, node):
+    if 'refdocname' in node and node['refdocname'] in self.builder.docnames:
+        self.body.append(self.context.pop())
 
 # newtheorem:
-def newtheorem(app, thmname, thmcaption, counter=None):
+def newtheorem(app, thmname, thmcaption, counter=None, within=None):
     """\
     Add new theorem.  It is thought as an analog of:
-    \\newtheorem{theorem_name}{caption}
+    \\newtheorem{theorem_name}{caption}[within]
 
-    counter is an instance of Counter.  If None (the default) the
-    constructed theorem will not be counted.
+    counter is the name of the counter.  If None (the default) the
+    constructed theorem will not be counted.  Theorems which share a counter
+    name are numbered together.
+
+    within is the name of a sectioning unit (one of clatex_sectionnames, e.g.
+    'chapter').  The counter is reset by it and prefixed with its number:
+    1.1, 1.2, ..., 2.1.  Theorems sharing a counter should use the same
+    within.
     """
 
     nodename = 'thmnode_%s' % thmname
@@ -426,7 +483,8 @@ def newtheorem(app, thmname, thmcaption, counter=None):
                     html = (visit_theorem_html, depart_theorem_html),
                     latex = (visit_theorem_latex, depart_theorem_latex),
                 )
-    TheoremDirective = TheoremDirectiveFactory(thmname, thmcaption, thmnode, counter)
+    TheoremDirective = TheoremDirectiveFactory(thmname, thmcaption, thmnode,
+                                               counter, within)
     app.add_directive(thmname, TheoremDirective)
 
 # setup:
@@ -457,6 +515,14 @@ def setup(app):
             latex = (visit_textcolor_latex, depart_textcolor_latex)
             )
 
+    app.add_role('thmref', thmref_role)
+    app.add_node(theorem_reference,
+            html = (visit_theorem_reference_html,
+                    depart_theorem_reference_html),
+            latex = (visit_theorem_reference_latex,
+                     depart_theorem_reference_latex)
+            )
+
     app.add_directive('endpar', EndParDirective)
     app.add_node(endpar,
             html = (visit_endpar_html, depart_endpar_html),
@@ -471,6 +537,17 @@ def setup(app):
     newtheorem(app, 'example', 'Example', 'theorem')
     newtheorem(app, 'exercise', 'Exercise', 'exercise')
 
+    # theorem numbers are kept per document in the environment and assigned
+    # after reading
+    app.connect('doctree-read', collect_theorems)
+    app.connect('env-purge-doc', purge_theorems)
+    app.connect('env-merge-info', merge_theorems)
+    app.connect('env-updated', number_theorems)
+    app.connect('doctree-resolved', stamp_theorems)
+    app.connect('doctree-resolved', resolve_theorem_references)
+
+    return {'parallel_read_safe': True, 'parallel_write_safe': True}
+
 # test if there is no global name which starts with 'thmnode_', 
 # these names are reserved for thmnodes (newtheorem()).
 for name in globals().copy():
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Index of an assembled doctree, built in one pass before it is translated.
+
+The LaTeX translator collects the footnotes of every document when it enters
+it (``visit_document`` and ``visit_start_of_file``), and Sphinx does that by
+traversing the subtree of the document again.  In a tree inlined from deeply
+nested toctrees that is a traversal per document.  :class:`DocumentIndex`
+walks the tree once and keeps the footnotes of every document node: the
+root, the ``start_of_file`` nodes and the appendices, which are documents
+appended to the root.
+"""
+
+from docutils import nodes
+from sphinx import addnodes
+from sphinx.writers.latex import collected_footnote
+
+
+class DocumentIndex(object):
+
+    def __init__(self, doctree):
+        # id of the document or start_of_file node -> its footnote nodes
+        self.footnote_nodes = {}
+        self.build(doctree)
+
+    def build(self, doctree):
+        # an explicit stack: recursion would hit the limit in big trees
+        stack = [(doctree, doctree)]
+        while stack:
+            node, filenode = stack.pop()
+            if isinstance(node, (addnodes.start_of_file, nodes.document)):
+                filenode = node
+            elif isinstance(node, nodes.footnote) and filenode is not None:
+                # like Sphinx, do not look for footnotes inside footnotes
+                self.footnote_nodes.setdefault(id(filenode), []).append(node)
+                filenode = None
+            if not isinstance(node, nodes.Element):
+                continue
+            # children are pushed in reverse, so that they are popped (and
+            # the footnotes collected) in document order
+            for child in reversed(node.children):
+                stack.append((child, filenode))
+
+    def footnotes(self, filenode):
+        """
+        The footnotes of the document ``filenode``, in the form of
+        ``LaTeXTranslator.collect_footnotes``: a fresh dict, since the
+        translator marks the footnotes it used.
+        """
+        fnotes = {}
+        for fn in self.footnote_nodes.get(id(filenode), ()):
+            num = fn.children[0].astext().strip()
+            # Sphinx 1.3 takes the number from the collected footnote
+            fnotes[num] = [collected_footnote(*fn.children, number=num),
+                           False]
+        return fnotes
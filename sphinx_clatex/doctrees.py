@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+Caches of doctrees used by the clatex builder.
+
+:class:`DoctreeCache` keeps the doctrees read by ``env.get_doctree`` in
+memory while the targets are written, so that documents shared by several
+targets are unpickled once.  Since assembling a target changes the trees it
+is given, every call gets a copy.
+
+:class:`AssembledDoctreeCache` keeps, for every target, the doctree built by
+``LaTeXBuilder.assemble_doctree``: with all the toctrees inlined and the
+references resolved.  It is keyed by the hashes of the pickled doctrees of
+all the documents it was assembled from, by the state of the environment
+references are resolved from (see :func:`resolve_digest`) and by the
+configuration, so a target whose documents did not change goes straight to
+translation.  State kept by other extensions (``missing-reference`` and
+``doctree-resolved`` handlers) is not part of the key, which is why the
+cache is optional.
+"""
+
+import os
+import time
+import errno
+import hashlib
+import cPickle as pickle
+from os import path
+from collections import OrderedDict
+
+from docutils import nodes
+from docutils.utils import Reporter
+
+from .manifest import file_digest, stat_key
+
+
+# the attributes of a document node which are not used once it was read
+# (the reporter, the settings, the mappings of ids and names to nodes, ...)
+# are not pickled for the documents of the appendices: they may point into
+# other trees
+ELEMENT_STATE = ('rawsource', 'children', 'attributes', 'tagname', 'parent',
+                 'document', 'source', 'line')
+
+
+def dump_doctree(doctree, filename):
+    """
+    Pickle ``doctree`` the way Sphinx pickles the read doctrees.  An
+    assembled tree also holds the ``document`` nodes of the appendices, of
+    which only the element state is pickled, and nodes moved from other
+    trees (``inline_all_toctrees`` does not set the parents of the children
+    it moves), which refer to their old documents and parents: for the time
+    of pickling they refer to ``doctree`` and to their actual parents.
+    """
+    saved = doctree.reporter, doctree.transformer, doctree.settings
+    doctree.reporter = doctree.transformer = doctree.settings = None
+    appendices = []
+    foreign = []
+    for node in doctree.traverse(nodes.Element):
+        if isinstance(node, nodes.document) and node is not doctree:
+            appendices.append((node, node.__dict__))
+            node.__dict__ = dict((name, value)
+                                 for name, value in node.__dict__.iteritems()
+                                 if name in ELEMENT_STATE)
+        for child in node.children:
+            document = child.__dict__.get('document')
+            if child.parent is not node or \
+                    (document is not None and document is not doctree):
+                foreign.append((child, child.parent, document))
+                child.parent = node
+                if document is not None:
+                    child.document = doctree
+    if doctree.__dict__.get('document') not in (None, doctree):
+        foreign.append((doctree, doctree.parent, doctree.document))
+        doctree.document = doctree
+    try:
+        with open(filename, 'wb') as f:
+            pickle.dump(doctree, f, pickle.HIGHEST_PROTOCOL)
+    finally:
+        for node, parent, document in reversed(foreign):
+            node.parent = parent
+            if document is not None:
+                node.document = document
+        for node, state in appendices:
+            node.__dict__ = state
+        doctree.reporter, doctree.transformer, doctree.settings = saved
+
+
+def load_doctree(filename, source):
+    with open(filename, 'rb') as f:
+        doctree = pickle.load(f)
+    for document in doctree.traverse(nodes.document):
+        document.reporter = Reporter(source, 2, 5)
+    return doctree
+
+
+def copy_doctree(node, parent=None):
+    """
+    Copy the tree under ``node``.  Unlike ``Node.deepcopy`` it does not run
+    the constructors, keeps ``source`` and ``line`` and copies the attributes
+    of the ``document`` node too.  Lists in the attributes (``ids``,
+    ``classes``, ...) are copied, other values are shared.  So are the
+    mappings of a ``document`` node (``ids``, ``nameids``, ...), which point
+    into the original tree; they are used only while reading.
+    """
+    if isinstance(node, nodes.Text):
+        new = node.__class__.__new__(node.__class__, node)
+    else:
+        new = node.__class__.__new__(node.__class__)
+    new.__dict__.update(node.__dict__)
+    new.parent = parent
+    if isinstance(node, nodes.Element):
+        new.attributes = dict(
+            (name, value[:] if isinstance(value, list) else value)
+            for name, value in node.attributes.iteritems())
+        new.children = [copy_doctree(child, new) for child in node.children]
+    return new
+
+
+class DoctreeCache(object):
+    """
+    LRU cache of the doctrees returned by ``env.get_doctree``, bounded by the
+    size of their pickles (the trees take several times more memory).
+    Install it with :meth:`install` for the time the targets are written.
+    """
+
+    def __init__(self, env, maxsize):
+        self.env = env
+        self.maxsize = maxsize
+        # docname -> (stat key of the pickle, size, doctree), oldest first
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.load_time = 0.0
+        self.copy_time = 0.0
+
+    def install(self):
+        self.env.get_doctree = self.get_doctree
+
+    def uninstall(self):
+        # remove the instance attribute, the class method is visible again
+        self.env.__dict__.pop('get_doctree', None)
+
+    def get_doctree(self, docname):
+        env = self.env
+        key = stat_key(env.doc2path(docname, env.doctreedir, '.doctree'))
+        entry = self.entries.pop(docname, None)
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            self.entries[docname] = entry
+            start = time.time()
+            doctree = copy_doctree(entry[2])
+            self.copy_time += time.time() - start
+            return doctree
+        if entry is not None:
+            self.size -= entry[1]
+        self.misses += 1
+        start = time.time()
+        doctree = env.__class__.get_doctree(env, docname)
+        self.load_time += time.time() - start
+        size = key and key[0] or 0
+        if size <= self.maxsize:
+            start = time.time()
+            self.entries[docname] = (key, size, copy_doctree(doctree))
+            self.copy_time += time.time() - start
+            self.size += size
+            while self.size > self.maxsize:
+                oldest, (_, oldsize, _) = self.entries.popitem(last=False)
+                self.size -= oldsize
+        return doctree
+
+    def counters(self):
+        return self.hits, self.misses, self.load_time, self.copy_time
+
+    def merge_counters(self, counters):
+        hits, misses, load_time, copy_time = counters
+        self.hits += hits
+        self.misses += misses
+        self.load_time += load_time
+        self.copy_time += copy_time
+
+    def reset_counters(self):
+        self.hits = self.misses = 0
+        self.load_time = self.copy_time = 0.0
+
+
+# the attributes of the environment, besides the doctrees, which resolving
+# the references of a doctree reads: the labels and objects, the titles of
+# the documents (:doc: references), the section and figure numbers and the
+# intersphinx inventory
+RESOLVE_STATE = ('domaindata', 'titles', 'toc_secnumbers', 'toc_fignumbers',
+                 'intersphinx_inventory')
+
+
+def canonical(value):
+    """
+    ``value`` with the dicts and sets in it sorted and the nodes turned into
+    text: pickles of equal values differ (e.g. before and after the
+    environment was pickled), its ``repr`` does not.
+    """
+    if isinstance(value, dict):
+        return sorted((canonical(key), canonical(item))
+                      for key, item in value.iteritems())
+    if isinstance(value, (set, frozenset)):
+        return sorted(canonical(item) for item in value)
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    if isinstance(value, nodes.Node):
+        return value.pformat()
+    return value
+
+
+def resolve_digest(env):
+    state = [(name, canonical(getattr(env, name, None)))
+             for name in RESOLVE_STATE]
+    return hashlib.sha1(repr(state)).hexdigest()
+
+
+class AssembledDoctreeCache(object):
+
+    def __init__(self, cachedir, doctreedir):
+        self.cachedir = cachedir
+        self.doctreedir = doctreedir
+        # digests of the pickled doctrees, by their size and mtime
+        self.digests = {}
+        self.hits = 0
+        self.misses = 0
+
+    def doctree_digest(self, docname):
+        filename = path.join(self.doctreedir, docname + '.doctree')
+        key = stat_key(filename)
+        if key is None:
+            return None
+        cached = self.digests.get(filename)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        digest = file_digest(filename)
+        self.digests[filename] = (key, digest)
+        return digest
+
+    def key(self, docnames, *extra):
+        """
+        The key of a tree assembled from ``docnames``; ``extra`` are any
+        other (repr-able) values the assembled tree depends on.
+        """
+        parts = [(docname, self.doctree_digest(docname))
+                 for docname in sorted(docnames)]
+        return hashlib.sha1(repr((parts, extra))).hexdigest()
+
+    def filenames(self, targetname):
+        base = path.join(self.cachedir, targetname)
+        return base + '.key', base + '.doctree'
+
+    def load(self, targetname, keyfunc):
+        """
+        Return ``(doctree, docnames)`` of the cached tree, or ``(None, None)``
+        if there is none or ``keyfunc(docnames)`` does not match its key.
+        """
+        keyfile, treefile = self.filenames(targetname)
+        try:
+            with open(keyfile, 'rb') as f:
+                key, docnames = pickle.load(f)
+            if key != keyfunc(docnames):
+                raise KeyError(key)
+            doctree = load_doctree(treefile, targetname)
+        except (IOError, EOFError, KeyError, ValueError,
+                pickle.UnpicklingError):
+            self.misses += 1
+            return None, None
+        self.hits += 1
+        return doctree, docnames
+
+    def store(self, targetname, key, docnames, doctree):
+        try:
+            os.makedirs(self.cachedir)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        keyfile, treefile = self.filenames(targetname)
+        # the key is written last: a tree without a valid key is never used
+        if path.exists(keyfile):
+            os.unlink(keyfile)
+        dump_doctree(doctree, treefile)
+        with open(keyfile, 'wb') as f:
+            pickle.dump((key, sorted(docnames)), f, pickle.HIGHEST_PROTOCOL)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Escaping of text for LaTeX.
+
+Sphinx escapes every text node with ``unicode.translate`` over
+``sphinx.util.texescape.tex_escape_map``, which looks every character up in
+the map.  :class:`TeXEscaper` produces the same output faster: one
+precompiled regular expression matching the characters of the map finds out
+whether a string needs escaping at all (most runs of prose do not), only the
+matched characters are replaced, and the results for short strings, which
+repeat a lot (words in emphasis, literals, table cells), are memoized.
+"""
+
+import re
+
+from sphinx.util import texescape
+
+
+class TeXEscaper(object):
+
+    # strings up to this length are memoized ...
+    memo_length = 64
+    # ... and the memo is emptied when it holds this many of them
+    memo_size = 20000
+
+    def __init__(self, escape_map):
+        self.replacements = dict((unichr(code), value)
+                                 for code, value in escape_map.iteritems())
+        self.pattern = re.compile(u'[%s]' % u''.join(
+            re.escape(char) for char in sorted(self.replacements)))
+        self.memo = {}
+
+    def replace(self, match):
+        return self.replacements[match.group()]
+
+    def escape(self, text):
+        if not isinstance(text, unicode):
+            text = unicode(text)
+        short = len(text) <= self.memo_length
+        if short:
+            escaped = self.memo.get(text)
+            if escaped is not None:
+                return escaped
+        if self.pattern.search(text) is None:
+            escaped = text
+        else:
+            escaped = self.pattern.sub(self.replace, text)
+        if short:
+            if len(self.memo) >= self.memo_size:
+                self.memo.clear()
+            self.memo[text] = escaped
+        return escaped
+
+    __call__ = escape
+
+
+_escaper = None
+
+def tex_escaper():
+    """
+    The :class:`TeXEscaper` of ``tex_escape_map``, which has to be
+    initialized by ``texescape.init()`` first.
+    """
+    global _escaper
+    if _escaper is None or \
+            len(_escaper.replacements) != len(texescape.tex_escape_map):
+        _escaper = TeXEscaper(texescape.tex_escape_map)
+    return _escaper
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Sharing of translated documents between targets.
+
+A document included by the toctrees of several ``latex_documents`` targets
+is a ``start_of_file`` node in each of their assembled doctrees.  With
+``clatex_share_fragments`` the translator keys every such subtree by the
+digest of its content and by the translator state it depends on (the section
+level, the default highlighting, pending labels, ...).  The LaTeX it
+produces, together with the state it leaves behind, is kept in a
+:class:`FragmentStore`, and a later target with the same key gets the
+fragment without walking the subtree.
+
+With ``clatex_fragment_cache`` the fragments are also stored by a backend,
+under the same content addressed keys, and so are reused by later builds,
+possibly on other machines.  A backend is an object with ``get(key)``,
+returning the stored string or None, and ``put(key, data)`` methods;
+:class:`DirectoryBackend` stores the fragments in a local directory or in a
+directory on a shared file system.  The fragments are stored as JSON, so
+that a shared cache never runs code from what it reads.
+"""
+
+import os
+import json
+import errno
+import hashlib
+import tempfile
+from os import path
+
+from docutils import nodes
+
+from .manifest import default_mode
+
+# part of every key; bump it when the translation of any node changes
+FRAGMENT_FORMAT = 2
+
+
+def subtree_digests(doctree, nodeclass):
+    """
+    The digests of the subtrees of all ``nodeclass`` nodes in ``doctree``,
+    by ``id()`` of the node.  Every node is hashed once, from its class, its
+    attributes and the digests of its children.
+    """
+    digests = {}
+    found = {}
+    stack = [(doctree, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if isinstance(node, nodes.Text):
+            digests[id(node)] = hashlib.sha1(
+                'Text:' + node.encode('utf-8')).digest()
+            continue
+        if not expanded:
+            stack.append((node, True))
+            stack.extend((child, False) for child in node.children)
+            continue
+        digest = hashlib.sha1(node.__class__.__name__)
+        digest.update(repr(sorted(node.attributes.iteritems())))
+        for child in node.children:
+            digest.update(digests.pop(id(child)))
+        digests[id(node)] = digest.digest()
+        if isinstance(node, nodeclass):
+            found[id(node)] = digest.hexdigest()
+    return found
+
+
+class DirectoryBackend(object):
+    """
+    Fragments stored in a directory, one file per key.  Files are written
+    under a temporary name and renamed, so builds running at the same time
+    (also on other machines sharing the directory) never read a partial one.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def filename(self, key):
+        return path.join(self.directory, key[:2], key[2:])
+
+    def get(self, key):
+        try:
+            with open(self.filename(key), 'rb') as f:
+                return f.read()
+        except IOError:
+            return None
+
+    def put(self, key, data):
+        filename = self.filename(key)
+        dirname = path.dirname(filename)
+        try:
+            os.makedirs(dirname)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        fd, tmpname = tempfile.mkstemp(dir=dirname)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # mkstemp creates the file readable by its owner only
+        os.chmod(tmpname, default_mode())
+        os.rename(tmpname, filename)
+
+
+def make_backend(builder, backend):
+    """
+    The backend of the ``clatex_fragment_cache_backend`` option: ``'local'``
+    for a directory next to the pickled doctrees, a directory (relative to
+    the configuration directory) or a callable which is given the builder
+    and returns a backend.
+    """
+    if callable(backend):
+        return backend(builder)
+    if backend == 'local':
+        return DirectoryBackend(path.join(builder.doctreedir,
+                                          'clatex-fragments'))
+    return DirectoryBackend(path.join(builder.confdir, backend))
+
+
+def dump_fragment(fragment):
+    """
+    Serialize a fragment: its state holds strings, numbers, lists and sets
+    (which become sorted lists).
+    """
+    return json.dumps(fragment, default=sorted, sort_keys=True)
+
+
+def load_fragment(data):
+    """
+    The fragment stored as ``data``, as lists instead of tuples and sets, or
+    None if it is not a fragment.
+    """
+    try:
+        fragment = json.loads(data)
+    except ValueError:
+        return None
+    if not isinstance(fragment, list) or len(fragment) != 2 or \
+            not isinstance(fragment[1], dict):
+        return None
+    return fragment
+
+
+class FragmentStore(object):
+    """
+    The translated fragments of a build, kept in memory and, if there is a
+    ``backend``, persistently.  A fragment is a ``(text, state)`` pair, see
+    ``CustomLaTeXTranslator.depart_start_of_file``.  The ``namespace`` is
+    part of every key; it identifies the configuration and the versions the
+    fragments depend on.
+    """
+
+    def __init__(self, namespace='', backend=None):
+        self.namespace = namespace
+        self.backend = backend
+        self.fragments = {}
+        # the fragments of the previous build, see new_build
+        self.previous = {}
+        self.hits = 0
+        self.backend_hits = 0
+        self.misses = 0
+
+    def key(self, *parts):
+        return hashlib.sha1(repr((FRAGMENT_FORMAT, self.namespace, parts))) \
+            .hexdigest()
+
+    def new_build(self):
+        """
+        Start a build which writes targets.  Only the fragments used or
+        translated by the previous such build are kept, so a store kept by the daemon does not grow
+        with every edit.
+        """
+        self.previous = self.fragments
+        self.fragments = {}
+
+    def get(self, key):
+        fragment = self.fragments.get(key)
+        if fragment is None:
+            fragment = self.previous.pop(key, None)
+            if fragment is not None:
+                self.fragments[key] = fragment
+        if fragment is None and self.backend is not None:
+            data = self.backend.get(key)
+            if data is not None:
+                fragment = load_fragment(data)
+                if fragment is not None:
+                    self.backend_hits += 1
+                    self.fragments[key] = fragment
+        if fragment is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return fragment
+
+    def put(self, key, fragment):
+        self.fragments[key] = fragment
+        if self.backend is not None:
+            self.backend.put(key, dump_fragment(fragment))
+
+    def counters(self):
+        return self.hits, self.backend_hits, self.misses
+
+    def merge_counters(self, counters):
+        hits, backend_hits, misses = counters
+        self.hits += hits
+        self.backend_hits += backend_hits
+        self.misses += misses
+
+    def reset_counters(self):
+        self.hits = self.backend_hits = self.misses = 0
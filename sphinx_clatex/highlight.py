@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent cache of Pygments highlighted code blocks.
+
+The highlighted LaTeX is stored in a directory, one file per code block,
+named by the hash of everything that influences the output: the language,
+the source, the Pygments style, ``trim_doctest_flags``, the keyword
+arguments of ``highlight_block`` (``linenos``, ``hl_lines``, ...) and the
+versions of Sphinx and Pygments.  The cache
+is shared by all targets and survives between builds; when it grows past its
+size limit the least recently used entries are removed.
+
+:func:`prehighlight` fills the cache before a target is translated: it
+collects the literal blocks of the assembled doctree, with the arguments the
+translator will highlight them with, and highlights the ones not in the
+cache in a pool of processes.  Both look the blocks up by the keys of
+:meth:`CachingPygmentsBridge.block_key`.
+"""
+
+import os
+import sys
+import errno
+import hashlib
+import tempfile
+import multiprocessing
+from os import path
+
+from docutils import nodes
+import sphinx
+from sphinx import addnodes
+from sphinx import highlighting
+from sphinx.writers.latex import LaTeXTranslator
+
+from .manifest import default_mode
+
+try:
+    import pygments
+except ImportError:
+    # Sphinx then writes the blocks without highlighting
+    pygments = None
+
+# part of every key: an upgrade may change the highlighted LaTeX
+VERSIONS = (sphinx.__version__, pygments and pygments.__version__)
+
+
+class HighlightCache(object):
+
+    def __init__(self, cachedir, maxsize):
+        self.cachedir = cachedir
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, *parts):
+        return hashlib.sha1(repr(parts)).hexdigest()
+
+    def filename(self, key):
+        return path.join(self.cachedir, key[:2], key[2:])
+
+    def __contains__(self, key):
+        return path.exists(self.filename(key))
+
+    def get(self, key):
+        filename = self.filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                data = f.read()
+        except IOError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            # the modification time orders the entries for eviction
+            os.utime(filename, None)
+        except OSError:
+            pass
+        return data.decode('utf-8')
+
+    def put(self, key, value):
+        filename = self.filename(key)
+        dirname = path.dirname(filename)
+        try:
+            os.makedirs(dirname)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        # write and rename, so that concurrent builds never read a partial
+        # entry
+        fd, tmpname = tempfile.mkstemp(dir=dirname)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(value.encode('utf-8'))
+        # mkstemp creates the file readable by its owner only
+        os.chmod(tmpname, default_mode())
+        os.rename(tmpname, filename)
+
+    def prune(self):
+        """Remove the least recently used entries above the size limit."""
+        entries = []
+        total = 0
+        for dirpath, dirnames, filenames in os.walk(self.cachedir):
+            for filename in filenames:
+                filename = path.join(dirpath, filename)
+                try:
+                    st = os.stat(filename)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, filename))
+                total += st.st_size
+        entries.sort()
+        for mtime, size, filename in entries:
+            if total <= self.maxsize:
+                break
+            try:
+                os.unlink(filename)
+            except OSError:
+                pass
+            total -= size
+
+
+class CachingPygmentsBridge(highlighting.PygmentsBridge):
+    """
+    PygmentsBridge which looks the highlighted blocks up in a
+    :class:`HighlightCache` first.
+    """
+
+    def __init__(self, cache, dest='html', stylename='sphinx',
+                 trim_doctest_flags=False):
+        highlighting.PygmentsBridge.__init__(self, dest, stylename,
+                                             trim_doctest_flags)
+        self.cache = cache
+        self.cache_settings = (dest, stylename, trim_doctest_flags)
+
+    def block_key(self, source, lang, kwargs):
+        """
+        The key of a block highlighted by ``highlight_block(source, lang,
+        **kwargs)``, without the ``warn`` argument.  The arguments differ
+        between Sphinx versions (1.3 added ``opts``), so they are all part of
+        the key.
+        """
+        return self.cache.key(VERSIONS, self.cache_settings, lang, source,
+                              normalized(kwargs))
+
+    def highlight_block(self, source, lang, **kwargs):
+        warn = kwargs.pop('warn', None)
+        key = self.block_key(source, lang, kwargs)
+        hlsource = self.cache.get(key)
+        if hlsource is not None:
+            return hlsource
+        warnings = []
+        def warner(msg):
+            warnings.append(msg)
+            if warn is not None:
+                warn(msg)
+        hlsource = highlighting.PygmentsBridge.highlight_block(
+            self, source, lang, warn=warner, **kwargs)
+        # blocks which produced warnings are not cached, so that the warnings
+        # are reported again on the next build
+        if not warnings:
+            self.cache.put(key, hlsource)
+        return hlsource
+
+
+def normalized(value):
+    """``value`` with the dicts in it turned into sorted lists of items."""
+    if isinstance(value, dict):
+        return sorted((key, normalized(item))
+                      for key, item in value.iteritems())
+    if isinstance(value, (list, tuple)):
+        return type(value)(normalized(item) for item in value)
+    return value
+
+
+class HighlightCall(Exception):
+    """The arguments of a ``highlight_block`` call, see :class:`BlockProbe`."""
+
+
+class CallRecorder(object):
+
+    def highlight_block(self, source, lang, **kwargs):
+        kwargs.pop('warn', None)
+        raise HighlightCall(source, lang, kwargs)
+
+
+class BlockProbe(object):
+    """
+    Stands for the translator in :func:`literal_blocks`: it has just what
+    ``LaTeXTranslator.visit_literal_block`` looks at, and its highlighter
+    stops the visitor with the arguments it would highlight the block with.
+    """
+
+    in_footnote = 0
+    table = None
+
+    def __init__(self, builder):
+        self.builder = builder
+        self.highlighter = CallRecorder()
+        self.body = []
+        self.curfilestack = ['']
+        self.hlsettingstack = 2 * [[builder.config.highlight_language,
+                                    sys.maxint]]
+
+    def highlight_call(self, node):
+        """
+        The ``(source, lang, kwargs)`` ``node`` is highlighted with by the
+        LaTeX translator of the running Sphinx, or None if it is not.
+        """
+        del self.body[:]
+        try:
+            LaTeXTranslator.visit_literal_block.im_func(self, node)
+        except HighlightCall as call:
+            return call.args
+        except nodes.SkipNode:
+            pass
+        return None
+
+
+def literal_blocks(doctree, builder):
+    """
+    Yield ``(source, lang, kwargs)`` of the literal and doctest blocks of
+    ``doctree``: the arguments of the ``highlight_block`` calls of the
+    translator, which are taken from its own ``visit_literal_block``.  The
+    ``highlight`` directives (``highlightlang`` nodes) are tracked per file
+    like the translator's ``hlsettingstack`` does.  Blocks with markup
+    (parsed literals) are left out.
+    """
+    probe = BlockProbe(builder)
+    hlsettingstack = probe.hlsettingstack
+    # (node, entering); start_of_file nodes are left again on (node, False)
+    stack = [(doctree, True)]
+    while stack:
+        node, entering = stack.pop()
+        if not entering:
+            hlsettingstack.pop()
+            continue
+        if isinstance(node, addnodes.highlightlang):
+            hlsettingstack[-1] = [node['lang'], node['linenothreshold']]
+            continue
+        if isinstance(node, (nodes.literal_block, nodes.doctest_block)):
+            call = probe.highlight_call(node)
+            if call is not None:
+                yield call
+            continue
+        if isinstance(node, addnodes.start_of_file):
+            hlsettingstack.append(hlsettingstack[0])
+            stack.append((node, False))
+        if isinstance(node, nodes.Element):
+            stack.extend((child, True) for child in reversed(node.children))
+
+
+# the bridges of a worker process, by their settings
+_bridges = {}
+
+def highlight_job(job):
+    """Highlight one block in a worker process, see :func:`prehighlight`."""
+    settings, source, lang, kwargs = job
+    bridge = _bridges.get(settings)
+    if bridge is None:
+        bridge = _bridges[settings] = highlighting.PygmentsBridge(*settings)
+    warnings = []
+    hlsource = bridge.highlight_block(source, lang, warn=warnings.append,
+                                      **kwargs)
+    return hlsource, bool(warnings)
+
+
+def prehighlight(bridge, doctree, builder, workers):
+    """
+    Highlight the literal blocks of ``doctree`` missing in the cache of the
+    :class:`CachingPygmentsBridge` ``bridge`` of the translator of
+    ``builder`` with ``workers`` processes, and
+    store them under the keys the translator will look them up by.  Blocks
+    which produce warnings are left to the translator, so that the warnings
+    are reported as usual.  Returns the number of highlighted blocks.
+    """
+    cache = bridge.cache
+    jobs = {}
+    for source, lang, kwargs in literal_blocks(doctree, builder):
+        key = bridge.block_key(source, lang, kwargs)
+        if key not in jobs and key not in cache:
+            jobs[key] = (bridge.cache_settings, source, lang, kwargs)
+    if not jobs:
+        return 0
+    keys = list(jobs)
+    pool = multiprocessing.Pool(min(workers, len(keys)))
+    try:
+        results = pool.map(highlight_job, [jobs[key] for key in keys],
+                           chunksize=max(1, len(keys) // (4 * workers)))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    for key, (hlsource, warned) in zip(keys, results):
+        if not warned:
+            cache.put(key, hlsource)
+    return len(keys)
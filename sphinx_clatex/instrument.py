@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of the phases of the clatex builder.
+
+Every phase of ``LaTeXBuilder.write``, ``assemble_doctree`` and ``finish``
+runs inside :meth:`PhaseRecorder.phase`, which records its wall time.  With
+``clatex_instrument`` enabled it also records the CPU time and the memory of
+the process, and emits the ``clatex-phase`` event::
+
+    def handler(app, targetname, phase, record):
+        ...
+
+    app.connect('clatex-phase', handler)
+
+and writes a JSON report of all the phases of each target to
+``_clatex_phases/<targetname>.json`` in the output directory (the phases of
+``finish`` go to ``_clatex_phases/finish.json``).  A record is a dict with the
+keys ``target``, ``phase``, ``wall``, ``cpu``, ``rss``, ``rss_delta`` and
+``maxrss``; some phases add ``nodes`` (the size of the doctree) or ``bytes``
+(written).
+
+``rss`` is the resident memory of the process at the end of the phase and
+``rss_delta`` its change during the phase, in bytes (read from
+``/proc/self/statm``, None where it does not exist).  ``maxrss`` is the peak
+RSS reported by :func:`resource.getrusage`: the peak over the whole life of
+the process, not of the phase, in the unit of the platform (kilobytes on
+Linux).
+"""
+
+import os
+import json
+import time
+import errno
+from os import path
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    PAGE_SIZE = None
+
+
+def cpu_time():
+    times = os.times()
+    return times[0] + times[1]
+
+
+def current_rss():
+    """The resident memory of the process in bytes, or None."""
+    if PAGE_SIZE is None:
+        return None
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (IOError, IndexError, ValueError):
+        return None
+
+
+def maxrss():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def count_nodes(doctree):
+    return sum(1 for node in doctree.traverse())
+
+
+class PhaseRecorder(object):
+
+    def __init__(self, app, enabled, reportdir):
+        self.app = app
+        self.enabled = enabled
+        self.reportdir = reportdir
+        # in worker processes the records are sent to the parent, which
+        # emits the events
+        self.deferred = False
+        self.records = {}
+
+    @contextmanager
+    def phase(self, target, name):
+        record = {'target': target, 'phase': name}
+        start = time.time()
+        if not self.enabled:
+            try:
+                yield record
+            finally:
+                record['wall'] = time.time() - start
+            return
+        start_cpu = cpu_time()
+        start_rss = current_rss()
+        try:
+            yield record
+        finally:
+            record['wall'] = time.time() - start
+            record['cpu'] = cpu_time() - start_cpu
+            record['rss'] = current_rss()
+            if start_rss is None or record['rss'] is None:
+                record['rss_delta'] = None
+            else:
+                record['rss_delta'] = record['rss'] - start_rss
+            record['maxrss'] = maxrss()
+            self.add(record)
+
+    def add(self, record):
+        self.records.setdefault(record['target'], []).append(record)
+        if not self.deferred:
+            self.app.emit('clatex-phase', record['target'], record['phase'],
+                          record)
+
+    def reset(self):
+        """Drop the records of the previous build."""
+        self.records = {}
+
+    def take(self, target):
+        """Remove and return the records of ``target``."""
+        return self.records.pop(target, [])
+
+    def replay(self, records):
+        for record in records:
+            self.add(record)
+
+    def write_report(self, target):
+        if not self.enabled:
+            return
+        try:
+            os.makedirs(self.reportdir)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        filename = path.join(self.reportdir, (target or 'finish') + '.json')
+        with open(filename, 'w') as f:
+            json.dump(self.records.get(target, []), f, indent=2,
+                      sort_keys=True)
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Content hash manifest of the files written by the clatex builder.
+
+Files whose content would not change are left untouched, so that their
+modification times stay the same and latexmk (or make) does not recompile
+the documents which did not change.
+"""
+
+import os
+import hashlib
+import threading
+import tempfile
+import subprocess
+import cPickle as pickle
+from os import path
+
+from docutils.io import FileOutput
+from sphinx.util.osutil import copyfile
+
+
+def file_digest(filename, blocksize=1 << 16):
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(blocksize)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# the values of clatex_copy_mode
+COPY_MODES = ('copy', 'hardlink', 'reflink')
+
+
+def copy_asset(src, dest, mode='copy'):
+    """
+    Copy ``src`` to ``dest``.  ``mode`` is one of:
+
+    ``'copy'``
+        copy the file,
+    ``'hardlink'``
+        hard link ``dest`` to ``src``,
+    ``'reflink'``
+        make a copy-on-write clone (``cp --reflink``, e.g. on btrfs or XFS).
+
+    Linking falls back to copying if the file system does not support it
+    (or ``src`` and ``dest`` are on different file systems).  An existing
+    ``dest`` is removed first, in every mode: it may be a link to ``src``
+    made by an earlier build.
+    """
+    if mode not in COPY_MODES:
+        raise ValueError('unknown copy mode: %r' % (mode,))
+    if path.lexists(dest):
+        os.unlink(dest)
+    if mode == 'hardlink':
+        try:
+            os.link(src, dest)
+            return
+        except OSError:
+            pass
+    elif mode == 'reflink':
+        try:
+            with open(os.devnull, 'w') as devnull:
+                if subprocess.call(['cp', '--reflink=always', src, dest],
+                                   stdout=devnull, stderr=devnull) == 0:
+                    return
+        except OSError:
+            pass
+    copyfile(src, dest)
+
+
+def default_mode():
+    # the mode open() would give to a new file
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def stat_key(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime)
+
+
+class WriteManifest(object):
+    """
+    Keeps the content hash of every file written to the output directory::
+
+        {relative path: (digest, (size, mtime))}
+
+    The size and modification time are used to detect files changed by
+    someone else.  Digests of copied source files are cached by their size
+    and modification time as well, so unchanged sources are not read again.
+
+    The manifest can be shared by threads copying files concurrently.
+    """
+
+    filename = '.clatex-manifest'
+
+    def __init__(self, outdir):
+        self.outdir = outdir
+        self.entries = {}
+        self.sources = {}
+        self.lock = threading.Lock()
+        self.load()
+        self.reset()
+
+    def reset(self):
+        self.touched = set()
+        self.written = 0
+        self.skipped = 0
+
+    def load(self):
+        try:
+            with open(path.join(self.outdir, self.filename), 'rb') as f:
+                self.entries, self.sources = pickle.load(f)
+        except (IOError, EOFError, ValueError, pickle.UnpicklingError):
+            self.entries, self.sources = {}, {}
+
+    def dump(self):
+        with open(path.join(self.outdir, self.filename), 'wb') as f:
+            pickle.dump((self.entries, self.sources), f,
+                        pickle.HIGHEST_PROTOCOL)
+
+    def unchanged(self, dest, digest):
+        with self.lock:
+            entry = self.entries.get(path.relpath(dest, self.outdir))
+        if entry is not None and entry[0] == digest and \
+                entry[1] == stat_key(dest):
+            with self.lock:
+                self.skipped += 1
+            return True
+        return False
+
+    def remember(self, dest, digest):
+        relpath = path.relpath(dest, self.outdir)
+        key = stat_key(dest)
+        with self.lock:
+            self.entries[relpath] = (digest, key)
+            self.touched.add(relpath)
+            self.written += 1
+
+    def source_digest(self, src):
+        key = stat_key(src)
+        with self.lock:
+            cached = self.sources.get(src)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        digest = file_digest(src)
+        with self.lock:
+            self.sources[src] = (key, digest)
+        return digest
+
+    def write_file(self, dest, data):
+        """Write ``data`` (bytes) to ``dest`` unless it already has it."""
+        digest = hashlib.sha1(data).hexdigest()
+        if self.unchanged(dest, digest):
+            return False
+        with open(dest, 'wb') as f:
+            f.write(data)
+        self.remember(dest, digest)
+        return True
+
+    def copy_file(self, src, dest, mode='copy'):
+        """
+        Copy ``src`` to ``dest`` unless ``dest`` has the same content.  See
+        :func:`copy_asset` for ``mode``.
+        """
+        digest = self.source_digest(src)
+        if self.unchanged(dest, digest):
+            return False
+        copy_asset(src, dest, mode)
+        self.remember(dest, digest)
+        return True
+
+    def open_stream(self, dest, encoding='utf-8'):
+        """
+        Return a :class:`ManifestStream` writing to ``dest`` piece by piece.
+        """
+        return ManifestStream(self, dest, encoding)
+
+    def changes(self):
+        """The entries and counters changed since :meth:`reset`."""
+        return (dict((relpath, self.entries[relpath])
+                     for relpath in self.touched),
+                self.sources, self.written, self.skipped)
+
+    def merge(self, changes):
+        entries, sources, written, skipped = changes
+        self.entries.update(entries)
+        self.sources.update(sources)
+        self.touched.update(entries)
+        self.written += written
+        self.skipped += skipped
+
+
+class ManifestFileOutput(FileOutput):
+    """
+    FileOutput which writes through a :class:`WriteManifest`.
+    """
+
+    def __init__(self, manifest, phase=None, **kwargs):
+        FileOutput.__init__(self, **kwargs)
+        self.manifest = manifest
+        # context manager factory instrumenting the write (see
+        # instrument.PhaseRecorder.phase)
+        self.phase = phase
+
+    def write(self, data):
+        if self.phase is None:
+            output = self.encode(data)
+            self.manifest.write_file(self.destination_path, output)
+            return output
+        with self.phase() as record:
+            output = self.encode(data)
+            self.manifest.write_file(self.destination_path, output)
+            record['bytes'] = len(output)
+        return output
+
+
+class ManifestStream(object):
+    """
+    File like object which writes text to a temporary file next to
+    ``dest``, hashing it on the way.  :meth:`close` moves it over ``dest``,
+    unless ``dest`` already has the same content.
+    """
+
+    def __init__(self, manifest, dest, encoding='utf-8'):
+        self.manifest = manifest
+        self.dest = dest
+        self.encoding = encoding
+        self.digest = hashlib.sha1()
+        self.size = 0
+        fd, self.tmpname = tempfile.mkstemp(dir=path.dirname(dest),
+                                            prefix='.', suffix='.tmp')
+        self.file = os.fdopen(fd, 'wb')
+
+    def write(self, text):
+        data = text.encode(self.encoding)
+        self.digest.update(data)
+        self.file.write(data)
+        self.size += len(data)
+
+    def close(self):
+        """Return True if ``dest`` was written."""
+        self.file.close()
+        digest = self.digest.hexdigest()
+        if self.manifest.unchanged(self.dest, digest):
+            os.unlink(self.tmpname)
+            return False
+        os.chmod(self.tmpname, default_mode())
+        os.rename(self.tmpname, self.dest)
+        self.manifest.remember(self.dest, digest)
+        return True
+
+    def discard(self):
+        self.file.close()
+        os.unlink(self.tmpname)
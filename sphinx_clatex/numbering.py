@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+Theorem numbering.
+
+Theorem numbers are not stamped while the documents are parsed.  When a
+document has been read, one walk over its doctree notes, in the build
+environment, the sequence of its sections, toctrees and counted theorems.
+After reading, numbers are assigned by a single linear pass over these
+sequences, expanding the toctrees from the master document: this is the
+order of the theorems in the resolved (inlined) doctree, independent of the
+order (or the process) in which the documents were read.  Counters declared
+``within`` a sectioning unit (e.g. ``'chapter'``) are reset by that unit and
+numbered like ``1.1, 1.2, ..., 2.1``.  As in LaTeX, a part does not reset the
+units below it, and the documents of ``latex_appendices`` restart the
+numbering of the top unit with letters: ``A.1, A.2, ..., B.1``.
+
+    env.clatex_theorems         {docname: [event, ...]}
+    env.clatex_theorem_numbers  {(docname, index): number}
+    env.clatex_theorem_labels   {docname: {label: (caption, index, id)}}
+    env.clatex_theorem_refs     {docname: set of referenced labels}
+    env.clatex_theorem_index    {label: (caption, number, docname, id)}
+
+where an event is one of::
+
+    ('section', depth)
+    ('toctree', depth, includefiles)
+    ('theorem', counter name, within)
+
+and ``depth`` is the number of sections enclosing the node in its document.
+
+The labels (``:name:``) of the theorems and the labels referenced by the
+``thmref`` role are noted in the same walk; the index of the labels, which
+the references are resolved by, is built right after the numbering.
+"""
+
+from docutils import nodes
+from sphinx import addnodes
+
+
+class Counter(object):
+    """\
+    A LaTeX like counter.  Counters are created by the numbering pass, one per
+    name, and live only while it runs.
+
+        >>> c = Counter('theorem')
+        >>> c.stepcounter()
+        >>> str(c)
+        '1'
+    """
+
+    def __init__(self, name, value=0, within=None):
+        self.name = name
+        self.value = value
+        self.within = within
+
+    def stepcounter(self):
+        self.value += 1
+
+    def addtocounter(self, value=1):
+        self.value += value
+
+    def setcounter(self, value):
+        self.value = value
+
+    def __str__(self):
+        return str(self.value)
+
+    def __unicode__(self):
+        return unicode(self.value)
+
+
+def env_theorems(env):
+    return env_dict(env, 'clatex_theorems')
+
+
+def env_dict(env, name):
+    try:
+        return getattr(env, name)
+    except AttributeError:
+        setattr(env, name, {})
+        return getattr(env, name)
+
+
+def collect_theorems(app, doctree):
+    """
+    Note the numbering events of the document just read and the index of
+    each of its theorems (connected to ``doctree-read``).
+    """
+    env = app.env
+    events = []
+    labels = {}
+    refs = set()
+    index = 0
+    stack = [(doctree, 0)]
+    while stack:
+        node, depth = stack.pop()
+        if not isinstance(node, nodes.Element):
+            continue
+        if isinstance(node, nodes.section):
+            depth += 1
+            events.append(('section', depth))
+        elif isinstance(node, addnodes.toctree):
+            events.append(('toctree', depth, list(node['includefiles'])))
+        elif 'thmcaption' in node:
+            thmindex = None
+            if 'thmcounter' in node:
+                events.append(('theorem', node['thmcounter'],
+                               node.get('thmwithin')))
+                node['thmdocname'] = env.docname
+                node['thmindex'] = thmindex = index
+                index += 1
+            if node['ids']:
+                for label in node['names']:
+                    labels[label] = (node['thmcaption'], thmindex,
+                                     node['ids'][0])
+        elif 'thmreflabel' in node:
+            refs.add(node['thmreflabel'])
+        stack.extend((child, depth) for child in reversed(node.children))
+    env_theorems(env)[env.docname] = events
+    env_dict(env, 'clatex_theorem_labels')[env.docname] = labels
+    env_dict(env, 'clatex_theorem_refs')[env.docname] = refs
+
+
+def purge_theorems(app, env, docname):
+    env_theorems(env).pop(docname, None)
+    env_dict(env, 'clatex_theorem_labels').pop(docname, None)
+    env_dict(env, 'clatex_theorem_refs').pop(docname, None)
+
+
+def merge_theorems(app, env, docnames, other):
+    for name in ('clatex_theorems', 'clatex_theorem_labels',
+                 'clatex_theorem_refs'):
+        mine = env_dict(env, name)
+        others = env_dict(other, name)
+        for docname in docnames:
+            if docname in others:
+                mine[docname] = others[docname]
+
+
+def alph(value):
+    """\
+    The letters of \Alph (extended like spreadsheet columns after Z).
+
+        >>> alph(1), alph(26), alph(27)
+        ('A', 'Z', 'AA')
+    """
+    letters = ''
+    while value > 0:
+        value, rest = divmod(value - 1, 26)
+        letters = chr(ord('A') + rest) + letters
+    return letters
+
+
+def top_sectionlevel(config):
+    # the same as in CustomLaTeXTranslator
+    if config.latex_use_parts:
+        return 0
+    elif config.clatex_use_chapters:
+        return 1
+    else:
+        return 2
+
+
+class TheoremNumbering(object):
+    """
+    One pass of the theorem numbering.
+
+    Depths are counted in the resolved doctree, where the title of the master
+    document is at depth 1 and the top sectioning unit (``chapter`` for
+    books) at depth 2, as the LaTeX writer treats them.
+    """
+
+    def __init__(self, app, env):
+        self.app = app
+        self.env = env
+        self.events = env_theorems(env)
+        self.sectionnames = env.config.clatex_sectionnames
+        self.top_sectionlevel = top_sectionlevel(env.config)
+        self.counters = {}
+        self.sections = []
+        self.numbers = {}
+        self.seen = set()
+        # depth of the unit numbered with letters, once in the appendices
+        self.appendix_depth = None
+
+    def within_depth(self, within):
+        if within is None:
+            return None
+        try:
+            level = self.sectionnames.index(within)
+        except ValueError:
+            self.app.warn('unknown sectioning unit %r used for theorem '
+                          'numbering' % within)
+            return None
+        return self.unit_depth(level)
+
+    def counter(self, name, within):
+        counter = self.counters.get(name)
+        if counter is None:
+            counter = self.counters[name] = \
+                Counter(name, within=self.within_depth(within))
+        return counter
+
+    def unit_depth(self, level):
+        """The depth of the sectioning unit ``level`` (0 for part)."""
+        return level - self.top_sectionlevel + 2
+
+    def section(self, depth):
+        while len(self.sections) < depth:
+            self.sections.append(0)
+        self.sections[depth - 1] += 1
+        if depth == self.unit_depth(0):
+            # \part resets neither the chapters nor the counters within them
+            reset = depth
+        else:
+            del self.sections[depth:]
+            reset = None
+        self.reset(depth, reset)
+
+    def reset(self, depth, only=None):
+        for counter in self.counters.itervalues():
+            if counter.within is None:
+                continue
+            if only is None and counter.within >= depth or \
+                    counter.within == only:
+                counter.setcounter(0)
+
+    def appendix(self):
+        """
+        Start the appendices: like \appendix, restart the numbering of the
+        top unit below part, which is from now on numbered with letters.
+        """
+        depth = self.unit_depth(max(self.top_sectionlevel, 1))
+        while len(self.sections) < depth:
+            self.sections.append(0)
+        del self.sections[depth:]
+        self.sections[depth - 1] = 0
+        self.reset(depth)
+        self.appendix_depth = depth
+
+    def number(self, counter):
+        if counter.within is None:
+            return str(counter)
+        # like \thechapter, \thesection: parts are not included
+        first = self.unit_depth(max(self.top_sectionlevel, 1))
+        prefix = []
+        for depth in range(first, counter.within + 1):
+            value = self.sections[depth - 1] \
+                if depth <= len(self.sections) else 0
+            if depth == self.appendix_depth and value > 0:
+                value = alph(value)
+            prefix.append(str(value))
+        return '.'.join(prefix + [str(counter)])
+
+    def process(self, docname, offset):
+        self.seen.add(docname)
+        index = 0
+        for event in self.events.get(docname, ()):
+            if event[0] == 'section':
+                self.section(offset + event[1])
+            elif event[0] == 'toctree':
+                for include in event[2]:
+                    if include not in self.seen:
+                        self.process(include, offset + event[1])
+            else:
+                counter = self.counter(event[1], event[2])
+                counter.stepcounter()
+                self.numbers[docname, index] = self.number(counter)
+                index += 1
+
+    def run(self):
+        self.process(self.env.config.master_doc, 0)
+        # the appendices and other documents outside of the toctrees come
+        # last; their top level sections are at the top sectioning unit
+        appendices = [docname for docname in
+                      getattr(self.env.config, 'latex_appendices', None) or ()
+                      if docname not in self.seen]
+        if appendices:
+            self.appendix()
+        for docname in appendices:
+            if docname not in self.seen:
+                self.process(docname, 1)
+        for docname in sorted(self.events):
+            if docname not in self.seen:
+                self.process(docname, 1)
+        return self.numbers
+
+
+def number_theorems(app, env):
+    """
+    Assign the theorem numbers (connected to ``env-updated``).  Returns the
+    documents whose numbers changed, so that they are written again even if
+    they were not read.
+    """
+    old_numbers = getattr(env, 'clatex_theorem_numbers', {})
+    numbers = TheoremNumbering(app, env).run()
+    env.clatex_theorem_numbers = numbers
+    changed = set(docname for (docname, index), number
+                  in numbers.iteritems()
+                  if old_numbers.get((docname, index)) != number)
+    changed.update(docname for (docname, index) in old_numbers
+                   if (docname, index) not in numbers and
+                   docname in env.all_docs)
+
+    old_index = getattr(env, 'clatex_theorem_index', {})
+    env.clatex_theorem_index = index = theorem_index(app, env)
+    changed_labels = set(label for label in set(index) | set(old_index)
+                         if index.get(label) != old_index.get(label))
+    if changed_labels:
+        changed.update(
+            docname for docname, refs
+            in env_dict(env, 'clatex_theorem_refs').iteritems()
+            if refs & changed_labels)
+    return sorted(changed)
+
+
+def theorem_index(app, env):
+    """
+    Return the index of the theorem labels of all the documents:
+    ``{label: (caption, number, docname, id)}``.
+    """
+    numbers = env.clatex_theorem_numbers
+    index = {}
+    for docname, labels in sorted(
+            env_dict(env, 'clatex_theorem_labels').iteritems()):
+        for label, (caption, thmindex, nodeid) in labels.iteritems():
+            if label in index:
+                app.warn('duplicate theorem label %r, other instance in %s'
+                         % (label, env.doc2path(index[label][2])),
+                         env.doc2path(docname))
+                continue
+            number = numbers.get((docname, thmindex), '') \
+                if thmindex is not None else ''
+            index[label] = (caption, number, docname, nodeid)
+    return index
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+Templates of the LaTeX output.
+
+They are kept apart from the writer, so that registering the extension does
+not import the LaTeX writer (see ``sphinx_clatex.builder``).
+"""
+
+HEADER = r'''%%%% File generated by Sphinx clatex builder
+%(documentclass)s
+
+%%%% Added by Sphinx:
+\usepackage[%(hyperref_args)s]{hyperref}
+%(longtable)s
+%(tabulary)s
+%(multirow)s
+%(makeidx)s
+%%%% Sphinx: addition's end.
+
+%(preamble)s
+'''
+
+BEGIN_DOC = \
+r'''
+\begin{document}
+%(begin_doc)s
+'''
+
+FOOTER = \
+r'''
+%(end_doc)s
+\end{document}
+'''
+
+# clatex_includeonly; the compile stage hides the file, see compile.py
+INCLUDEONLY = \
+r'''
+\InputIfFileExists{%s-includeonly.tex}{}{}
+'''
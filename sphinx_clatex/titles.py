@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Lookup of the titles of the LaTeX targets by document name.
+
+A reference to a document which is not part of the target being written
+cannot be turned into a cross-reference; it is rendered as "section (in
+title)", where title is the title of the first target (in ``latex_documents``
+order) whose directory is a prefix of the referenced document.
+"""
+
+
+class TitleIndex(object):
+    """
+    Prefix tree over the target directories.
+
+        >>> index = TitleIndex([('manual/', 'Manual'), ('', 'Everything')])
+        >>> index.lookup('manual/intro')
+        'Manual'
+        >>> index.lookup('faq')
+        'Everything'
+
+    A lookup walks the characters of the document name once, instead of
+    comparing it with every target, and its result is memoized since the same
+    documents are referenced over and over again.
+    """
+
+    def __init__(self, titles):
+        """``titles`` is a list of ``(subdir, title)`` pairs."""
+        self.root = {}
+        for index, (subdir, title) in enumerate(titles):
+            node = self.root
+            for char in subdir:
+                node = node.setdefault(char, {})
+            # the first target wins, like in a linear scan
+            node.setdefault(None, (index, title))
+        self.cache = {}
+
+    def lookup(self, docname):
+        """Return the title for ``docname`` or None."""
+        try:
+            return self.cache[docname]
+        except KeyError:
+            pass
+        node = self.root
+        best = node.get(None)
+        for char in docname:
+            node = node.get(char)
+            if node is None:
+                break
+            entry = node.get(None)
+            if entry is not None and (best is None or entry[0] < best[0]):
+                best = entry
+        title = best[1] if best is not None else None
+        self.cache[docname] = title
+        return title
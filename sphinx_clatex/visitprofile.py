@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Profile of the LaTeX translator by node type.
+
+With ``clatex_profile_visitors`` set, the writer uses
+:class:`~sphinx_clatex.writer.ProfilingLaTeXTranslator`, which times every
+``visit_*`` and ``depart_*`` call and counts the characters it appends to the
+body.  The times are exclusive: the children of a node are visited by the
+walk, not by the visitor of the node.  The profiles of all targets (also the
+ones written by worker processes) are summed up and printed as a table at the
+end of the build.
+"""
+
+from timeit import default_timer as timer
+
+
+class VisitorProfile(object):
+
+    def __init__(self):
+        # node type -> [visits, visit time, depart time, characters]
+        self.stats = {}
+        # total time of the walks, including the dispatching
+        self.walk_time = 0.0
+
+    def add(self, nodetype, field, elapsed, chars):
+        stats = self.stats.get(nodetype)
+        if stats is None:
+            stats = self.stats[nodetype] = [0, 0.0, 0.0, 0]
+        if field == 1:
+            stats[0] += 1
+        stats[field] += elapsed
+        stats[3] += chars
+
+    def add_walk(self, elapsed):
+        self.walk_time += elapsed
+
+    def state(self):
+        """The picklable state, see :meth:`merge`."""
+        return self.stats, self.walk_time
+
+    def merge(self, state):
+        stats, walk_time = state
+        for nodetype, values in stats.iteritems():
+            mine = self.stats.setdefault(nodetype, [0, 0.0, 0.0, 0])
+            for index, value in enumerate(values):
+                mine[index] += value
+        self.walk_time += walk_time
+
+    def table(self, top):
+        """The ``top`` node types with the most time as lines of text."""
+        rows = sorted(self.stats.iteritems(),
+                      key=lambda item: item[1][1] + item[1][2], reverse=True)
+        lines = ['%-24s %8s %10s %10s %10s' % ('node', 'visits', 'visit [s]',
+                                               'depart [s]', 'chars')]
+        for nodetype, (visits, visit, depart, chars) in rows[:top]:
+            lines.append('%-24s %8d %10.4f %10.4f %10d'
+                         % (nodetype, visits, visit, depart, chars))
+        total = sum(values[1] + values[2] for values in self.stats.itervalues())
+        lines.append('visitors %.4fs, dispatching %.4fs'
+                     % (total, max(self.walk_time - total, 0.0)))
+        return lines
+
+
+def body_growth(translator, body, length):
+    """
+    The number of characters appended to ``body`` since it had ``length``
+    fragments, or 0 if the translator redirected its body meanwhile.
+    """
+    if translator.body is not body or len(body) < length:
+        return 0
+    return sum(len(fragment) for fragment in body[length:])
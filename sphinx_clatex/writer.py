@@ -4,48 +4,90 @@ LaTeX writer for Sphinx which allows to use arbitrary LaTeX class.
 """
 
 import sys
+import copy
 from os import path
 from docutils import nodes
+from sphinx import addnodes
 from sphinx import highlighting
 import sphinx.writers.latex
 from sphinx.util.osutil import ustrftime
 from sphinx.ext.mathbase import latex_visit_math, latex_visit_displaymath, latex_visit_eqref
 
 from .directives import *
+# not in directives.__all__
+from .directives import (visit_environment_latex, depart_environment_latex,
+                         visit_textcolor_latex, depart_textcolor_latex,
+                         visit_endpar_latex, depart_endpar_latex,
+                         visit_align_latex, depart_align_latex)
+from .highlight import CachingPygmentsBridge
+from .visitprofile import timer, body_growth
+from .templates import HEADER, BEGIN_DOC, FOOTER, INCLUDEONLY
+from .escape import tex_escaper
+from .docindex import DocumentIndex
+from .fragments import subtree_digests
 
-HEADER = r'''%%%% File generated by Sphinx clatex builder
-%(documentclass)s
 
-%%%% Added by Sphinx:
-\usepackage[%(hyperref_args)s]{hyperref}
-%(longtable)s
-%(tabulary)s
-%(multirow)s
-%(makeidx)s
-%%%% Sphinx: addition's end.
+class StreamingBody(list):
+    """
+    The body of a translator which moves its contents to a stream once they
+    grow above ``chunksize`` characters.  The translator must not flush it
+    while a visitor still refers to its contents, see ``flush_stream``.
+    """
 
-%(preamble)s
-'''
+    def __init__(self, stream, chunksize):
+        list.__init__(self)
+        self.stream = stream
+        self.chunksize = chunksize
+        self.counted = 0
+        self.size = 0
 
-BEGIN_DOC = \
-r'''
-\begin{document}
-%(begin_doc)s
-'''
+    def flush(self, force=False):
+        for fragment in self[self.counted:]:
+            self.size += len(fragment)
+        self.counted = len(self)
+        if not self or not force and self.size < self.chunksize:
+            return
+        self.stream.write(u''.join(self))
+        del self[:]
+        self.counted = 0
+        self.size = 0
 
-FOOTER = \
-r'''
-%(end_doc)s
-\end{document}
-'''
 
 class CustomLaTeXWriter(sphinx.writers.latex.LaTeXWriter):
 
+    def translator(self, document):
+        if getattr(self.builder, 'visitor_profile', None) is not None:
+            return ProfilingLaTeXTranslator(document, self.builder)
+        return CustomLaTeXTranslator(document, self.builder)
+
+    def walk(self, document, visitor):
+        profile = getattr(self.builder, 'visitor_profile', None)
+        if profile is None:
+            document.walkabout(visitor)
+            return
+        start = timer()
+        document.walkabout(visitor)
+        profile.add_walk(timer() - start)
+
     def translate(self):
-        visitor = CustomLaTeXTranslator(self.document, self.builder)
-        self.document.walkabout(visitor)
+        visitor = self.translator(self.document)
+        self.walk(self.document, visitor)
+        visitor.finish_chapters()
         self.output = visitor.astext()
 
+    def write_stream(self, document, stream, chunksize):
+        """
+        Translate ``document`` writing the output to ``stream`` in chunks of
+        about ``chunksize`` characters, instead of keeping all of it in
+        memory.  The preamble is written before the document is walked.
+        """
+        self.document = document
+        visitor = self.translator(document)
+        visitor.start_stream(stream, chunksize)
+        self.walk(document, visitor)
+        visitor.finish_chapters()
+        visitor.finish_stream()
+
 class CustomLaTeXTranslator(sphinx.writers.latex.LaTeXTranslator, nodes.NodeVisitor, object):
 
     default_elements = {
@@ -79,6 +121,9 @@ class CustomLaTeXTranslator(sphinx.writers.latex.LaTeXTranslator, nodes.NodeVisi
         # "- 1" because the level is increased before the title is visited
         self.sectionlevel = self.top_sectionlevel - 1
 
+    def collect_footnotes(self, node):
+        return self.docindex.footnotes(node)
+
     # todo: I should find a real solution
     def visit_transition(self, node):
         try:
@@ -92,6 +137,25 @@ class CustomLaTeXTranslator(sphinx.writers.latex.LaTeXTranslator, nodes.NodeVisi
         nodes.NodeVisitor.__init__(self, document)
         self.builder = builder
         self.body = []
+        self.stream = None
+        # number of open visitors which hold an index into the body
+        self.body_marks = 0
+        self.split_chapters = builder.config.clatex_split_chapters
+        self.includeonly = self.split_chapters and \
+            builder.config.clatex_includeonly
+        self.chapter_base = path.splitext(
+            getattr(document.settings, 'targetname', 'document'))[0]
+        self.filedepth = 0
+        # stack of (key, outer body, state) of the start_of_file nodes being
+        # translated, see visit_start_of_file
+        self.fragments = []
+        self.fragment_store = getattr(builder, 'fragment_store', None)
+        if self.fragment_store is not None:
+            self.fragment_digests = subtree_digests(document,
+                                                    addnodes.start_of_file)
+        self.changed_chapters = []
+        self.escape = tex_escaper()
+        self.docindex = DocumentIndex(document)
         self.sectionnames = builder.app.config.clatex_sectionnames
         self.elements = self.default_elements.copy()
         if type(builder.config.clatex_makeidx) == bool:
@@ -111,8 +175,14 @@ class CustomLaTeXTranslator(sphinx.writers.latex.LaTeXTranslator, nodes.NodeVisi
             'hyperref_args': builder.config.clatex_hyperref_args,
             'makeidx':      makeidx,
             })
-        self.highlighter = highlighting.PygmentsBridge('latex',
-            builder.config.pygments_style, builder.config.trim_doctest_flags)
+        if getattr(builder, 'highlight_cache', None) is not None:
+            self.highlighter = CachingPygmentsBridge(builder.highlight_cache,
+                'latex', builder.config.pygments_style,
+                builder.config.trim_doctest_flags)
+        else:
+            self.highlighter = highlighting.PygmentsBridge('latex',
+                builder.config.pygments_style,
+                builder.config.trim_doctest_flags)
         self.context = []
         self.descstack = []
         self.bibitems = []
@@ -124,7 +194,10 @@ class CustomLaTeXTranslator(sphinx.writers.latex.LaTeXTranslator, nodes.NodeVisi
         # by .. highlight:: directive in the master file
         self.hlsettingstack = 2 * [[builder.config.highlight_language,
                                     sys.maxint]]
+        self.bodystack = []
         self.footnotestack = []
+        self.footnote_restricted = False
+        self.pending_footnotes = []
         self.curfilestack = []
         self.handled_abbrs = set()
         if builder.config.latex_use_parts:
@@ -137,12 +210,16 @@ class CustomLaTeXTranslator(sphinx.writers.latex.LaTeXTranslator, nodes.NodeVisi
         self.next_section_ids = set()
         self.next_figure_ids = set()
         self.next_table_ids = set()
+        self.next_literal_ids = set()
         # flags
         self.verbatim = None
         self.in_title = 0
         self.in_production_list = 0
         self.in_footnote = 0
         self.in_caption = 0
+        self.in_container_literal_block = 0
+        self.in_term = 0
+        self.in_merged_cell = 0
         self.first_document = 1
         self.this_is_the_title = 1
         self.literal_whitespace = 0
@@ -154,17 +231,177 @@ class CustomLaTeXTranslator(sphinx.writers.latex.LaTeXTranslator, nodes.NodeVisi
         self.remember_multirow = {}
         self.remember_multirowcol = {}
 
-    def astext(self):
+    def preamble(self):
         HEADER = self.builder.app.config.clatex_header
+        preamble = HEADER % self.elements
         if self.builder.config.clatex_highlighter:
-            return (HEADER % self.elements +
-                    self.highlighter.get_stylesheet() +
-                    u''.join(self.body) +
-                    FOOTER % self.elements)
+            preamble += self.highlighter.get_stylesheet()
+        if self.includeonly:
+            preamble += INCLUDEONLY % self.chapter_base
+        return preamble
+
+    def astext(self):
+        return (self.preamble() +
+                u''.join(self.body) +
+                FOOTER % self.elements)
+
+    def start_stream(self, stream, chunksize):
+        self.stream = stream
+        self.stream.write(self.preamble())
+        self.body = StreamingBody(stream, chunksize)
+
+    def finish_stream(self):
+        self.body.flush(force=True)
+        self.stream.write(FOOTER % self.elements)
+
+    def dispatch_departure(self, node):
+        sphinx.writers.latex.LaTeXTranslator.dispatch_departure(self, node)
+        self.flush_stream()
+
+    def flush_stream(self):
+        # flush only when the output is not redirected (tables), no visitor
+        # is collecting text and none holds an index into the body
+        if (self.stream is not None and
+                isinstance(self.body, StreamingBody) and
+                self.table is None and self.verbatim is None and
+                not self.body_marks and
+                not (self.in_title or self.in_footnote or self.in_caption)):
+            self.body.flush()
+
+    # depart_citation moves the text added to the body since visit_citation
+    # (it saves the length of the body) to the bibliography
+    def visit_citation(self, node):
+        self.body_marks += 1
+        sphinx.writers.latex.LaTeXTranslator.visit_citation(self, node)
+
+    def depart_citation(self, node):
+        sphinx.writers.latex.LaTeXTranslator.depart_citation(self, node)
+        self.body_marks -= 1
+
+    def encode(self, text):
+        # same as LaTeXTranslator.encode, with a faster escaping
+        text = self.escape(text)
+        if self.literal_whitespace:
+            # Insert a blank before the newline, to avoid
+            # ! LaTeX Error: There's no line here to end.
+            text = text.replace(u'\n', u'~\\\\\n').replace(u' ', u'~')
+        if self.no_contractions:
+            text = text.replace('--', u'-{-}')
+            text = text.replace("''", u"'{'}")
+        return text
+
+    # clatex_split_chapters: every top level toctree document is written to
+    # its own file, which is \include'd by the master file
+    def chapter_name(self, docname):
+        return '%s-%s' % (self.chapter_base, docname.replace('/', '-'))
+
+    # The output of every start_of_file node is collected apart (if it is
+    # shared or written to its own file) and then added by add_fragment.
+    def visit_start_of_file(self, node):
+        key = self.fragment_key(node)
+        if key is not None:
+            fragment = self.fragment_store.get(key)
+            if fragment is not None:
+                text, state = fragment
+                self.restore_fragment_state(state)
+                self.add_fragment(node, text)
+                raise nodes.SkipNode
+        sphinx.writers.latex.LaTeXTranslator.visit_start_of_file(self, node)
+        if key is not None or (self.split_chapters and self.filedepth == 0):
+            self.fragments.append((key, self.body, self.fragment_state()))
+            self.body = []
+        else:
+            self.fragments.append(None)
+        self.filedepth += 1
+
+    def depart_start_of_file(self, node):
+        self.filedepth -= 1
+        collected = self.fragments.pop()
+        if collected is not None:
+            key, body, state = collected
+            text = u''.join(self.body)
+            self.body = body
+            if key is not None:
+                self.fragment_store.put(
+                    key, (text, self.fragment_state(state)))
+            self.add_fragment(node, text)
+        sphinx.writers.latex.LaTeXTranslator.depart_start_of_file(self, node)
+
+    def add_fragment(self, node, text):
+        if self.split_chapters and self.filedepth == 0:
+            name = self.chapter_name(node['docname'])
+            self.write_chapter(name, text)
+            self.body.append(u'\n\\include{%s}\n' % name)
+        else:
+            self.body.append(text)
+
+    # clatex_share_fragments
+    def fragment_key(self, node):
+        """
+        The key of the translation of the start_of_file ``node``, or None if
+        it must not be shared.
+        """
+        if self.fragment_store is None or self.this_is_the_title or \
+                self.table is not None or self.in_footnote:
+            return None
+        return self.fragment_store.key(
+            self.fragment_digests[id(node)],
+            self.sectionlevel, self.top_sectionlevel, self.sectionnames,
+            self.hlsettingstack[0],
+            self.fragment_state()['exit'],
+            sorted(self.handled_abbrs))
+
+    def fragment_state(self, entry=None):
+        """
+        The translator state a fragment depends on and leaves behind.  Given
+        the ``entry`` state, return what the fragment changed: the
+        bibliography items and abbreviations it added and the labels waiting
+        for the next section, figure or table.
+        """
+        state = {
+            'exit': (sorted(self.next_section_ids),
+                     sorted(self.next_figure_ids),
+                     sorted(self.next_table_ids),
+                     self.next_table_colspec),
+        }
+        if entry is None:
+            state['bibitems'] = len(self.bibitems)
+            state['abbrs'] = set(self.handled_abbrs)
+        else:
+            state['bibitems'] = copy.deepcopy(
+                self.bibitems[entry['bibitems']:])
+            state['abbrs'] = sorted(self.handled_abbrs - entry['abbrs'])
+        return state
+
+    def restore_fragment_state(self, state):
+        self.bibitems.extend(copy.deepcopy(state['bibitems']))
+        self.handled_abbrs.update(state['abbrs'])
+        section_ids, figure_ids, table_ids, colspec = state['exit']
+        self.next_section_ids = set(section_ids)
+        self.next_figure_ids = set(figure_ids)
+        self.next_table_ids = set(table_ids)
+        self.next_table_colspec = colspec
+
+    def write_chapter(self, name, text):
+        filename = path.join(self.builder.outdir, name + '.tex')
+        if self.builder.manifest.write_file(filename, text.encode('utf-8')):
+            self.changed_chapters.append(name)
+
+    def finish_chapters(self):
+        """
+        Write the \\includeonly list of the chapters which changed
+        (clatex_includeonly), so that only those are typeset.  If none
+        changed, the whole document is.
+        """
+        if not self.includeonly:
+            return
+        filename = path.join(self.builder.outdir,
+                             '%s-includeonly.tex' % self.chapter_base)
+        if self.changed_chapters:
+            text = u'\\includeonly{%s}\n' % u','.join(self.changed_chapters)
         else:
-            return (HEADER % self.elements +
-                    u''.join(self.body) +
-                    FOOTER % self.elements)
+            text = u'% no chapter changed: the whole document is typeset\n'
+        self.builder.manifest.write_file(filename, text.encode('utf-8'))
 
     def visit_environment(self, node):
         visit_environment_latex(self, node)
@@ -210,3 +447,36 @@ class CustomLaTeXTranslator(sphinx.writers.latex.LaTeXTranslator, nodes.NodeVisi
         pass
     def depart_iflatex(self, node):
         pass
+
+
+class ProfilingLaTeXTranslator(CustomLaTeXTranslator):
+    """
+    Translator which records, for every node type, the number of visits, the
+    time spent in its visitors and the characters they append to the body in
+    ``builder.visitor_profile`` (see :mod:`sphinx_clatex.visitprofile`).
+    """
+
+    def __init__(self, document, builder):
+        CustomLaTeXTranslator.__init__(self, document, builder)
+        self.profile = builder.visitor_profile
+
+    def dispatch_visit(self, node):
+        body = self.body
+        length = len(body)
+        start = timer()
+        try:
+            CustomLaTeXTranslator.dispatch_visit(self, node)
+        finally:
+            self.profile.add(node.__class__.__name__, 1, timer() - start,
+                             body_growth(self, body, length))
+
+    def dispatch_departure(self, node):
+        body = self.body
+        length = len(body)
+        start = timer()
+        try:
+            sphinx.writers.latex.LaTeXTranslator.dispatch_departure(self, node)
+        finally:
+            self.profile.add(node.__class__.__name__, 2, timer() - start,
+                             body_growth(self, body, length))
+        self.flush_stream()
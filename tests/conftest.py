@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+from StringIO import StringIO
+
+import pytest
+from sphinx.application import Sphinx
+
+CONF = """\
+extensions = ['sphinx_clatex']
+master_doc = 'index'
+latex_documents = [('index', 'test.tex', u'Test', u'Author', 'manual')]
+"""
+
+
+@pytest.fixture
+def make_app(tmpdir):
+    """
+    Return a function creating a Sphinx application with the clatex builder
+    for a project of the given ``{filename: content}`` files (the ``conf.py``
+    above unless it is given) and configuration overrides.  Called again, it
+    writes only the files whose content changed, so that the others are not
+    read again.
+    """
+    def make(files, **confoverrides):
+        srcdir = tmpdir.join('src')
+        srcdir.ensure(dir=True)
+        files = dict(files)
+        files.setdefault('conf.py', CONF)
+        for filename, content in files.iteritems():
+            if isinstance(content, unicode):
+                content = content.encode('utf-8')
+            source = srcdir.join(filename)
+            if not source.check() or source.read('rb') != content:
+                source.write(content, 'wb', ensure=True)
+        outdir = tmpdir.join('out')
+        return Sphinx(str(srcdir), str(srcdir), str(outdir),
+                      str(outdir.join('.doctrees')), 'clatex',
+                      confoverrides, status=StringIO(), warning=StringIO())
+    return make
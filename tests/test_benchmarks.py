@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+"""
+Smoke tests of the benchmarks: they run end to end on a small corpus.
+"""
+
+from benchmarks.corpus import generate
+from benchmarks.bench_build import build, PHASES
+
+
+def test_bench_build(tmpdir):
+    srcdir = generate(str(tmpdir.join('src')), docs=6, fanout=2, blocks=1,
+                      targets=2)
+    timings = build(srcdir, str(tmpdir.join('build')))
+    assert set(PHASES) <= set(timings)
+    assert timings['resolve'] > 0
+    # the corpus uses the environment, align and textcolor directives
+    output = tmpdir.join('build', 'out', 'bench.tex').read()
+    assert '\\begin{remark}' in output
+    assert 'Centered paragraph number' in output
+    assert '\\textcolor[HTML]{00FF00}' in output
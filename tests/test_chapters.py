@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the split output (clatex_split_chapters, clatex_includeonly).
+"""
+
+from os import path
+
+FILES = {
+    'index.rst': u"""\
+Title
+=====
+
+.. toctree::
+
+   one
+   two
+""",
+    'one.rst': u"""\
+One
+===
+
+The first chapter.
+""",
+    'two.rst': u"""\
+Two
+===
+
+The second chapter.
+""",
+}
+
+
+def build(make_app, files=FILES, **confoverrides):
+    confoverrides.setdefault('clatex_split_chapters', True)
+    app = make_app(files, **confoverrides)
+    app.build()
+    return app.builder.outdir
+
+
+def read(outdir, filename):
+    with open(path.join(outdir, filename)) as f:
+        return f.read()
+
+
+def test_split_chapters(make_app):
+    outdir = build(make_app)
+    master = read(outdir, 'test.tex')
+    assert '\\include{test-one}' in master
+    assert '\\include{test-two}' in master
+    assert 'The first chapter' in read(outdir, 'test-one.tex')
+    # the draft mode is off
+    assert 'includeonly' not in master
+    assert not path.exists(path.join(outdir, 'test-includeonly.tex'))
+
+
+def test_includeonly_lists_the_changed_chapters(make_app):
+    outdir = build(make_app, clatex_includeonly=True)
+    assert 'test-includeonly.tex' in read(outdir, 'test.tex')
+    assert read(outdir, 'test-includeonly.tex') == \
+        '\\includeonly{test-one,test-two}\n'
+    files = dict(FILES)
+    files['two.rst'] = files['two.rst'].replace('second', 'last')
+    build(make_app, files, clatex_includeonly=True)
+    assert read(outdir, 'test-includeonly.tex') == '\\includeonly{test-two}\n'
+
+
+def test_includeonly_is_never_empty(make_app):
+    outdir = build(make_app, clatex_includeonly=True)
+    # the target is written again, but no chapter changed
+    build(make_app, clatex_includeonly=True, clatex_preamble='% changed')
+    assert '\\includeonly' not in read(outdir, 'test-includeonly.tex')
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the compile stage (clatex_compile), with a fake TeX engine.
+"""
+
+import sys
+from os import path
+
+import pytest
+from sphinx.errors import SphinxError
+
+FILES = {
+    'index.rst': u"""\
+Title
+=====
+
+Text.
+""",
+}
+
+# the name of the .tex file is appended to the commands
+WRITE_PDF = [sys.executable, '-c', """\
+import sys
+open(sys.argv[1].split('/')[-1][:-4] + '.pdf', 'w').write('PDF')
+"""]
+NO_PDF = [sys.executable, '-c', 'print "no output"']
+FAIL = [sys.executable, '-c', 'import sys; print "fatal error"; sys.exit(1)']
+
+
+def build(make_app, command):
+    app = make_app(FILES, clatex_compile=True,
+                   clatex_compile_command=command)
+    app.build()
+    return app.builder.outdir
+
+
+def test_compile(make_app):
+    outdir = build(make_app, WRITE_PDF)
+    with open(path.join(outdir, 'test.pdf')) as f:
+        assert f.read() == 'PDF'
+
+
+def test_failed_command(make_app):
+    with pytest.raises(SphinxError) as excinfo:
+        build(make_app, FAIL)
+    assert 'test.tex' in str(excinfo.value)
+
+
+def test_missing_pdf(make_app):
+    with pytest.raises(SphinxError) as excinfo:
+        build(make_app, NO_PDF)
+    assert 'test.tex' in str(excinfo.value)
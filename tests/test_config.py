@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the invalidation by changed options: no clatex option makes Sphinx
+read the sources again, and only the targets depending on an option are
+written again (sphinx_clatex.depends).
+"""
+
+from os import path
+
+import pytest
+import sphinx
+from sphinx.errors import VersionRequirementError
+
+from conftest import CONF
+from sphinx_clatex.depends import NON_OUTPUT_CONFIG
+
+FILES = {
+    'conf.py': CONF + """\
+latex_documents.append(('other', 'other.tex', u'Other', u'Author',
+                        'manual'))
+""",
+    'index.rst': u"""\
+Title
+=====
+
+Text.
+""",
+    'other.rst': u"""\
+:orphan:
+
+Other
+=====
+""",
+}
+
+
+def build(make_app, **confoverrides):
+    app = make_app(FILES, **confoverrides)
+    read = []
+    app.connect('doctree-read',
+                lambda app, doctree: read.append(app.env.docname))
+    app.build()
+    return read, sorted(app.builder.written_targets), app
+
+
+def test_clatex_options_do_not_read_again(make_app):
+    build(make_app)
+    read, written, app = build(make_app, clatex_preamble='% changed')
+    assert read == []
+    assert written == ['other.tex', 'test.tex']
+    with open(path.join(app.builder.outdir, 'test.tex')) as f:
+        assert '% changed' in f.read()
+
+
+def test_options_without_output_write_nothing(make_app):
+    build(make_app)
+    read, written, app = build(make_app, clatex_copy_workers=4,
+                               clatex_instrument=True)
+    assert 'clatex_copy_workers' in NON_OUTPUT_CONFIG
+    assert (read, written) == ([], [])
+
+
+def test_no_clatex_option_invalidates_the_environment(make_app):
+    read, written, app = build(make_app)
+    for name, (default, rebuild) in app.config.config_values.iteritems():
+        if name.startswith('clatex_'):
+            assert not rebuild, name
+
+
+def test_old_sphinx_is_rejected(make_app, monkeypatch):
+    monkeypatch.setattr(sphinx, '__display_version__', '1.2.3')
+    with pytest.raises(VersionRequirementError):
+        make_app(FILES)
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the rebuilds of the daemon (sphinx_clatex.daemon).
+"""
+
+import time
+from StringIO import StringIO
+
+from conftest import CONF
+from sphinx_clatex.daemon import Daemon
+
+
+def test_rebuild(tmpdir):
+    srcdir = tmpdir.join('src')
+    srcdir.join('conf.py').write(CONF, ensure=True)
+    index = srcdir.join('index.rst')
+    index.write('Title\n=====\n\nText.\n')
+    outdir = tmpdir.join('out')
+    daemon = Daemon(str(srcdir), str(srcdir), str(outdir),
+                    str(outdir.join('.doctrees')), status=StringIO(),
+                    warning=StringIO())
+    daemon.start()
+    index.write('Title\n=====\n\nChanged text.\n')
+    report = daemon.rebuild([str(index)], time.time())
+    assert '1 changed file: test.tex written' in report
+    assert 'Changed text' in outdir.join('test.tex').read()
+    report = daemon.rebuild([str(srcdir.join('other'))], time.time())
+    assert 'nothing written' in report
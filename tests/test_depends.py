@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the incremental rebuilds: only the targets whose inputs changed are
+written again (sphinx_clatex.depends).
+"""
+
+from conftest import CONF
+
+FILES = {
+    'conf.py': CONF + """\
+latex_documents.append(('b', 'b.tex', u'B', u'Author', 'manual'))
+""",
+    'index.rst': u"""\
+Title
+=====
+
+.. toctree::
+
+   a
+   b
+""",
+    'a.rst': u"""\
+A
+=
+
+.. theorem:: in a
+
+   Text.
+""",
+    'b.rst': u"""\
+B
+=
+
+.. theorem:: in b
+
+   Text.
+""",
+}
+
+
+def build(make_app, files=FILES, **confoverrides):
+    app = make_app(files, **confoverrides)
+    app.build()
+    return sorted(app.builder.written_targets)
+
+
+def changed(docname, text):
+    files = dict(FILES)
+    files[docname + '.rst'] = FILES[docname + '.rst'] + text
+    return files
+
+
+def test_up_to_date_targets_are_skipped(make_app):
+    assert build(make_app) == ['b.tex', 'test.tex']
+    assert build(make_app) == []
+    # b.tex does not include a
+    assert build(make_app, changed('a', u'\nMore text.\n')) == ['test.tex']
+    assert build(make_app, changed('b', u'\nMore text.\n')) == \
+        ['b.tex', 'test.tex']
+
+
+def test_changed_options(make_app):
+    build(make_app)
+    assert build(make_app, latex_show_urls='footnote') == \
+        ['b.tex', 'test.tex']
+    assert build(make_app, latex_show_urls='footnote') == []
+
+
+def test_renumbered_targets_are_written(make_app):
+    build(make_app)
+    # a new theorem in a renumbers the theorem of b, which is not read again
+    files = changed('a', u'\n.. theorem:: second\n\n   Text.\n')
+    assert build(make_app, files) == ['b.tex', 'test.tex']
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the index of the footnotes of an assembled doctree
+(sphinx_clatex.docindex).
+"""
+
+from os import path
+
+from conftest import CONF
+
+FILES = {
+    'conf.py': CONF + "latex_appendices = ['appendix']\n",
+    'index.rst': u"""\
+Title
+=====
+
+.. toctree::
+
+   chapter
+
+A footnote of the root [#f]_.
+
+.. [#f] The footnote of the root.
+""",
+    'chapter.rst': u"""\
+Chapter
+=======
+
+A footnote of the chapter [#f]_.
+
+.. [#f] The footnote of the chapter.
+""",
+    'appendix.rst': u"""\
+:orphan:
+
+Appendix
+========
+
+A footnote of the appendix [#f]_.
+
+.. [#f] The footnote of the appendix.
+""",
+}
+
+
+def test_footnotes_of_every_document(make_app):
+    app = make_app(FILES)
+    app.build()
+    with open(path.join(app.builder.outdir, 'test.tex')) as f:
+        output = f.read()
+    body, appendix = output.split('\\appendix')
+    # every footnote is typeset in its own document
+    assert 'The footnote of the root' in body
+    assert 'The footnote of the chapter' in body
+    assert 'The footnote of the appendix' in appendix
+    assert output.count('\\footnote') == 3
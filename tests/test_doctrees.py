@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the caches of doctrees (clatex_assembled_cache and
+clatex_doctree_cache_size).
+"""
+
+from os import path
+
+from conftest import CONF
+
+FILES = {
+    'conf.py': CONF + "latex_appendices = ['appendix']\n",
+    'index.rst': u"""\
+Title
+=====
+
+.. toctree::
+
+   chapter
+
+See :doc:`other`.
+""",
+    'chapter.rst': u"""\
+Chapter
+=======
+
+A footnote [#f]_.
+
+.. [#f] The footnote of the chapter.
+""",
+    'appendix.rst': u"""\
+:orphan:
+
+Appendix
+========
+
+A footnote [#f]_.
+
+.. [#f] The footnote of the appendix.
+""",
+    'other.rst': u"""\
+:orphan:
+
+Other
+=====
+""",
+}
+
+
+def build(make_app, files=FILES, force_all=False, **confoverrides):
+    confoverrides.setdefault('clatex_assembled_cache', True)
+    app = make_app(files, **confoverrides)
+    app.build(force_all=force_all)
+    with open(path.join(app.builder.outdir, 'test.tex')) as f:
+        output = f.read()
+    cache = app.builder.assembled_cache
+    return output, (cache.hits, cache.misses)
+
+
+def test_assembled_tree_is_reused(make_app):
+    first, counters = build(make_app)
+    assert counters == (0, 1)
+    second, counters = build(make_app, clatex_preamble='% changed')
+    assert counters == (1, 0)
+    assert second.replace('% changed', '') == first
+
+
+def test_force_all_assembles_again(make_app):
+    build(make_app)
+    output, counters = build(make_app, force_all=True)
+    assert counters == (0, 0)
+
+
+
+SHARED = {
+    'conf.py': CONF + """\
+latex_documents.extend([
+    ('part1', 'part1.tex', u'Part 1', u'Author', 'manual'),
+    ('part2', 'part2.tex', u'Part 2', u'Author', 'manual'),
+])
+""",
+    'index.rst': u"""\
+Title
+=====
+
+.. toctree::
+
+   part1
+   part2
+""",
+    'part1.rst': u"""\
+Part 1
+======
+
+.. toctree::
+
+   shared
+""",
+    'part2.rst': u"""\
+Part 2
+======
+
+.. toctree::
+
+   shared
+""",
+    'shared.rst': u"""\
+Shared
+======
+
+Text of the shared document.
+""",
+}
+
+TARGETS = ('test.tex', 'part1.tex', 'part2.tex')
+
+
+def build_targets(make_app, **confoverrides):
+    app = make_app(SHARED, **confoverrides)
+    app.build(force_all=True)
+    outputs = []
+    for targetname in TARGETS:
+        with open(path.join(app.builder.outdir, targetname)) as f:
+            outputs.append(f.read())
+    return outputs, app.builder.doctree_cache
+
+
+def test_doctree_cache(make_app):
+    expected, cache = build_targets(make_app)
+    assert cache is None
+    outputs, cache = build_targets(make_app,
+                                   clatex_doctree_cache_size=1 << 20)
+    assert outputs == expected
+    # index, part1, part2 and shared are read once; shared is read by every
+    # target, the parts by two
+    hits, misses = cache.counters()[:2]
+    assert misses == 4 and hits > 0
+    # the targets changed their copies, not the cached trees
+    outputs, cache = build_targets(make_app,
+                                   clatex_doctree_cache_size=1 << 20)
+    assert outputs == expected
+
+
+def test_doctree_cache_evicts(make_app):
+    expected, cache = build_targets(make_app)
+    # room for a single doctree: every document is read again
+    outputs, cache = build_targets(make_app, clatex_doctree_cache_size=1)
+    assert outputs == expected
+    assert cache.hits == 0 and not cache.entries
+    app = make_app(SHARED)
+    sizes = sorted(path.getsize(app.env.doc2path(docname, app.doctreedir,
+                                                 '.doctree'))
+                   for docname in app.env.all_docs)
+    outputs, cache = build_targets(make_app,
+                                   clatex_doctree_cache_size=sizes[-1])
+    assert outputs == expected
+    assert cache.size <= sizes[-1]
+    assert len(cache.entries) == 1
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the escaping of text for LaTeX (sphinx_clatex.escape).
+"""
+
+from os import path
+
+import sphinx.writers.latex
+from sphinx.util import texescape
+
+from sphinx_clatex.escape import TeXEscaper
+from sphinx_clatex.writer import CustomLaTeXTranslator
+
+texescape.init()
+
+TEXTS = [u'', u'plain words', u'$ & % # _ { } ~ ^ \\', u'[x] <y> "q" |z|',
+         u'– — ‘quote’ € ␣ °',
+         u'a--b and \'\'c\'\'', u'x' * 100 + u'$', u'x' * 100]
+
+
+def test_same_as_translate():
+    escaper = TeXEscaper(texescape.tex_escape_map)
+    every = u''.join(unichr(code) for code in texescape.tex_escape_map)
+    for text in TEXTS + [every, every * 3]:
+        expected = text.translate(texescape.tex_escape_map)
+        # twice: computed, then from the memo
+        assert escaper(text) == expected
+        assert escaper(text) == expected
+    assert escaper('bytes & str') == u'bytes \\& str'
+
+
+def test_full_memo_is_emptied():
+    escaper = TeXEscaper(texescape.tex_escape_map)
+    escaper.memo_size = 3
+    for number in range(10):
+        text = u'%d & %d' % (number, number)
+        assert escaper(text) == text.replace(u'&', u'\\&')
+        assert len(escaper.memo) <= 3
+
+
+SOURCE = u"""\
+Title $ & %
+===========
+
+Text with $ & % # _ { } ~ ^ \\\\ -- 'quotes' – € and ``literal -- $``.
+
+::
+
+   literal block with  spaces & -- ''
+
+.. only:: latex
+
+   Line block:
+
+   | first $ line
+   |   second  line
+"""
+
+
+def build(make_app):
+    app = make_app({'index.rst': SOURCE})
+    app.build(force_all=True)
+    with open(path.join(app.builder.outdir, 'test.tex')) as f:
+        return f.read()
+
+
+def test_same_output_as_sphinx_encode(make_app, monkeypatch):
+    output = build(make_app)
+    monkeypatch.setattr(CustomLaTeXTranslator, 'encode',
+                        sphinx.writers.latex.LaTeXTranslator.encode.im_func)
+    assert build(make_app) == output
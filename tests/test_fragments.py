@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the persistent cache of translated documents (clatex_fragment_cache).
+"""
+
+import os
+import stat
+from os import path
+
+from sphinx_clatex.fragments import DirectoryBackend
+
+FILES = {
+    'index.rst': u"""\
+Title
+=====
+
+.. toctree::
+
+   chapter
+""",
+    'chapter.rst': u"""\
+Chapter
+=======
+
+A citation [CIT]_ and a :abbr:`LIFO (last-in, first-out)` abbreviation.
+
+.. [CIT] The text of the citation.
+
+.. _label:
+""",
+}
+
+
+def build(make_app, **confoverrides):
+    app = make_app(FILES, clatex_fragment_cache=True, **confoverrides)
+    app.build(force_all=True)
+    with open(path.join(app.builder.outdir, 'test.tex')) as f:
+        return f.read(), app.builder.fragment_store
+
+
+def test_fragments_are_reused(make_app):
+    first, store = build(make_app)
+    assert store.counters() == (0, 0, 1)
+    second, store = build(make_app)
+    assert store.counters() == (1, 1, 0)
+    # the text and the state left behind (bibliography, labels) are restored
+    assert second == first
+    assert 'The text of the citation' in second
+
+
+def test_translation_options_are_in_the_key(make_app):
+    build(make_app)
+    output, store = build(make_app, latex_show_urls='footnote')
+    assert store.counters() == (0, 0, 1)
+
+
+def test_stored_as_json(make_app):
+    output, store = build(make_app)
+    key, = store.fragments
+    data = store.backend.get(key)
+    assert data.startswith('[')
+    # a damaged file is a miss
+    store.backend.put(key, 'cos\nsystem\n')
+    store.fragments.clear()
+    assert store.get(key) is None
+
+
+def test_unused_fragments_are_dropped(make_app):
+    app = make_app(FILES, clatex_share_fragments=True)
+    app.build()
+    store = app.builder.fragment_store
+    old, = store.fragments
+    files = dict(FILES)
+    files['chapter.rst'] = files['chapter.rst'].replace('citation.', 'cite.')
+    make_app(files)
+    app.build()
+    app.build(force_all=True)
+    # the fragment of the old chapter is dropped after one build which
+    # does not use it
+    assert len(store.fragments) == 1
+    assert old not in store.fragments and old not in store.previous
+
+
+def test_stored_files_follow_the_umask(tmpdir):
+    backend = DirectoryBackend(str(tmpdir))
+    umask = os.umask(0o022)
+    try:
+        backend.put('ab' * 20, '[]')
+    finally:
+        os.umask(umask)
+    mode = stat.S_IMODE(os.stat(backend.filename('ab' * 20)).st_mode)
+    assert mode == 0o644
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the highlighting cache and of the highlighting before translation
+(clatex_highlight_workers).
+"""
+
+import os
+import stat
+
+from sphinx_clatex.highlight import HighlightCache
+
+CACHE_SIZE = 1024 * 1024
+
+INDEX = u"""\
+Title
+=====
+
+.. toctree::
+
+   code
+
+Some code::
+
+    print 'default language'
+
+.. highlight:: c
+   :linenothreshold: 2
+
+::
+
+    int main()
+    {
+        return 0;
+    }
+"""
+
+CODE = u"""\
+Code
+====
+
+.. code-block:: python
+   :linenos:
+   :emphasize-lines: 1
+
+   def f():
+       return 1
+
+.. parsed-literal::
+
+   *parsed* literal
+
+>>> 1 + 1
+2
+
+::
+
+    not highlighted as c: the highlight directive is per file
+"""
+
+
+def test_prehighlight_fills_the_keys_of_the_translator(make_app):
+    app = make_app({'index.rst': INDEX, 'code.rst': CODE},
+                   clatex_highlight_cache_size=CACHE_SIZE,
+                   clatex_highlight_workers=2,
+                   highlight_options={'stripnl': False})
+    app.build()
+    cache = app.builder.highlight_cache
+    # every highlighted block was found in the cache
+    assert (cache.hits, cache.misses) == (5, 0)
+
+
+def test_cache_is_used_by_later_builds(make_app):
+    app = make_app({'index.rst': INDEX, 'code.rst': CODE},
+                   clatex_highlight_cache_size=CACHE_SIZE)
+    app.build()
+    cache = app.builder.highlight_cache
+    assert (cache.hits, cache.misses) == (0, 5)
+    with open(app.builder.outdir + '/test.tex') as f:
+        first = f.read()
+    app = make_app({'index.rst': INDEX, 'code.rst': CODE},
+                   clatex_highlight_cache_size=CACHE_SIZE)
+    app.build(force_all=True)
+    cache = app.builder.highlight_cache
+    assert (cache.hits, cache.misses) == (5, 0)
+    with open(app.builder.outdir + '/test.tex') as f:
+        assert f.read() == first
+
+
+def test_cache_is_off_by_default(make_app):
+    app = make_app({'index.rst': INDEX, 'code.rst': CODE})
+    app.build()
+    assert app.builder.highlight_cache is None
+
+
+def test_least_recently_used_entries_are_pruned(tmpdir):
+    cache = HighlightCache(str(tmpdir), 25)
+    for number, key in enumerate(['aa01', 'bb02', 'cc03']):
+        cache.put(key, u'%d' % number * 10)
+        os.utime(cache.filename(key), (number, number))
+    # reading an entry makes it the most recently used
+    assert cache.get('aa01') == u'0' * 10
+    cache.prune()
+    assert 'aa01' in cache and 'cc03' in cache
+    assert 'bb02' not in cache
+    assert cache.get('bb02') is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_entries_follow_the_umask(tmpdir):
+    cache = HighlightCache(str(tmpdir), CACHE_SIZE)
+    umask = os.umask(0o002)
+    try:
+        cache.put('ab01', u'entry')
+    finally:
+        os.umask(umask)
+    assert stat.S_IMODE(os.stat(cache.filename('ab01')).st_mode) == 0o664
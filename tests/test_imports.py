@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the modules imported when the extension is loaded.
+"""
+
+import sys
+import json
+import subprocess
+from os import path
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+SCRIPT = '''
+import sys, json
+sys.path.insert(0, %r)
+import sphinx.application
+import sphinx_clatex
+print(json.dumps(sorted(sys.modules)))
+'''
+
+# needed only when the clatex builder runs (or, mathbase, when the extension
+# is set up)
+LAZY = ['sphinx.writers.latex', 'sphinx.highlighting', 'sphinx.ext.mathbase',
+        'sphinx_clatex.writer', 'sphinx_clatex.highlight',
+        'sphinx_clatex.compile']
+
+
+def test_writer_is_not_imported_with_the_extension():
+    output = subprocess.check_output([sys.executable, '-c', SCRIPT % ROOT])
+    modules = set(json.loads(output))
+    assert 'sphinx_clatex.builder' in modules
+    assert [name for name in LAZY if name in modules] == []
+
+
+def test_html_build_does_not_import_the_writer(make_app):
+    # the writer is not imported by the setup and the reading either
+    app = make_app({'index.rst': u'Title\n=====\n\n:math:`x`\n'})
+    app.build()
+    script = SCRIPT % ROOT + '''
+from sphinx.application import Sphinx
+from StringIO import StringIO
+app = Sphinx(%r, %r, %r, %r, 'html', status=StringIO(), warning=StringIO())
+app.build()
+print(json.dumps('sphinx_clatex.writer' in sys.modules))
+''' % (app.srcdir, app.confdir, app.outdir + '-html',
+       app.doctreedir + '-html')
+    lines = subprocess.check_output([sys.executable, '-c', script]) \
+        .splitlines()
+    assert json.loads(lines[-1]) is False
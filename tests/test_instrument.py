@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the instrumentation of the phases (clatex_instrument).
+"""
+
+import json
+from os import path
+
+FILES = {
+    'index.rst': u"""\
+Title
+=====
+
+Text.
+""",
+}
+
+
+def build(make_app):
+    app = make_app(FILES, clatex_instrument=True)
+    records = []
+    app.connect('clatex-phase',
+                lambda app, target, phase, record: records.append(record))
+    app.build()
+    return app, records
+
+
+def test_phase_records(make_app):
+    app, records = build(make_app)
+    assert records
+    for record in records:
+        assert record['wall'] >= 0
+        if path.exists('/proc/self/statm'):
+            assert record['rss'] > 0
+            assert isinstance(record['rss_delta'], (int, long))
+    with open(path.join(app.builder.outdir, '_clatex_phases',
+                        'test.tex.json')) as f:
+        report = json.load(f)
+    assert [record['phase'] for record in report] == \
+        [record['phase'] for record in records
+         if record['target'] == 'test.tex']
+
+
+def test_reports_of_one_build(make_app):
+    app, records = build(make_app)
+    app.build(force_all=True)
+    with open(path.join(app.builder.outdir, '_clatex_phases',
+                        'test.tex.json')) as f:
+        report = json.load(f)
+    # the second build has the same phases, the first is not reported again
+    assert len(report) == len([record for record in records
+                               if record['target'] == 'test.tex']) / 2
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the content hash manifest of the written files
+(sphinx_clatex.manifest).
+"""
+
+import os
+from os import path
+
+import pytest
+from sphinx.errors import ConfigError
+
+from sphinx_clatex.manifest import WriteManifest, COPY_MODES, copy_asset
+
+
+def test_unchanged_files_are_not_written(tmpdir):
+    outdir = str(tmpdir)
+    dest = path.join(outdir, 'file.tex')
+    manifest = WriteManifest(outdir)
+    assert manifest.write_file(dest, 'content')
+    os.utime(dest, (0, 0))
+    manifest.remember(dest, manifest.entries['file.tex'][0])
+    manifest.dump()
+
+    manifest = WriteManifest(outdir)
+    assert not manifest.write_file(dest, 'content')
+    assert os.stat(dest).st_mtime == 0
+    assert manifest.write_file(dest, 'new content')
+    assert (manifest.written, manifest.skipped) == (1, 1)
+
+
+def test_files_changed_by_others_are_written(tmpdir):
+    outdir = str(tmpdir)
+    dest = path.join(outdir, 'file.tex')
+    manifest = WriteManifest(outdir)
+    manifest.write_file(dest, 'content')
+    with open(dest, 'wb') as f:
+        f.write('edited')
+    assert manifest.write_file(dest, 'content')
+    with open(dest, 'rb') as f:
+        assert f.read() == 'content'
+
+
+def test_copied_files(tmpdir):
+    src = tmpdir.join('image.png')
+    src.write('image')
+    outdir = tmpdir.mkdir('out')
+    dest = str(outdir.join('image.png'))
+    manifest = WriteManifest(str(outdir))
+    assert manifest.copy_file(str(src), dest)
+    assert not manifest.copy_file(str(src), dest)
+    src.write('new image')
+    assert manifest.copy_file(str(src), dest)
+    assert outdir.join('image.png').read() == 'new image'
+
+
+def test_build_skips_unchanged_outputs(make_app):
+    files = {'index.rst': u'Title\n=====\n\nText.\n'}
+    app = make_app(files)
+    app.build()
+    texfile = path.join(app.builder.outdir, 'test.tex')
+    os.utime(texfile, (0, 0))
+    # the manifest keeps the stat of the written file
+    manifest = app.builder.manifest
+    manifest.remember(texfile, manifest.entries['test.tex'][0])
+    manifest.dump()
+    app = make_app(files)
+    app.build(force_all=True)
+    assert os.stat(texfile).st_mtime == 0
+    assert app.builder.manifest.written == 0
+    assert app.builder.manifest.skipped > 0
+
+
+def test_copy_modes(tmpdir):
+    src = tmpdir.join('image.png')
+    src.write('image')
+    outdir = tmpdir.mkdir('out')
+    for mode in COPY_MODES:
+        dest = outdir.join(mode + '.png')
+        copy_asset(str(src), str(dest), mode)
+        assert dest.read() == 'image'
+    assert os.stat(str(outdir.join('hardlink.png'))).st_ino == \
+        os.stat(str(src)).st_ino
+    with pytest.raises(ValueError):
+        copy_asset(str(src), str(outdir.join('x.png')), 'symlink')
+
+
+def test_linked_assets_are_replaced(tmpdir):
+    src = tmpdir.join('image.png')
+    src.write('image')
+    dest = tmpdir.join('out.png')
+    copy_asset(str(src), str(dest), 'hardlink')
+    # copying over the link must not write through it into the source
+    other = tmpdir.join('other.png')
+    other.write('other')
+    copy_asset(str(other), str(dest), 'copy')
+    assert src.read() == 'image'
+    assert dest.read() == 'other'
+
+
+def test_copy_workers_and_modes(make_app, tmpdir):
+    files = {'index.rst': u'Title\n=====\n\n.. image:: image.png\n'}
+    make_app(files)
+    tmpdir.join('src', 'image.png').write('PNG')
+    app = make_app(files, clatex_copy_workers=4,
+                   clatex_copy_mode='hardlink')
+    app.build()
+    image = path.join(app.builder.outdir, 'image.png')
+    assert os.stat(image).st_ino == \
+        os.stat(str(tmpdir.join('src', 'image.png'))).st_ino
+    with pytest.raises(ConfigError):
+        make_app(files, clatex_copy_mode='symlink')
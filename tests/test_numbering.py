@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the theorem numbering pass (sphinx_clatex.numbering).
+"""
+
+from sphinx_clatex.numbering import TheoremNumbering, number_theorems, alph
+
+SECTIONNAMES = ["part", "chapter", "section", "subsection", "subsubsection",
+                "paragraph", "subparagraph"]
+
+
+class Config(object):
+
+    def __init__(self, **options):
+        self.master_doc = 'index'
+        self.clatex_sectionnames = SECTIONNAMES
+        self.clatex_use_chapters = True
+        self.latex_use_parts = False
+        self.latex_appendices = []
+        self.__dict__.update(options)
+
+
+class Env(object):
+
+    def __init__(self, events, **options):
+        self.config = Config(**options)
+        self.clatex_theorems = events
+        self.all_docs = dict((docname, 0) for docname in events)
+
+    def doc2path(self, docname):
+        return docname + '.rst'
+
+
+class App(object):
+
+    def __init__(self):
+        self.warnings = []
+
+    def warn(self, message, location=None):
+        self.warnings.append(message)
+
+
+def number(events, **options):
+    return TheoremNumbering(App(), Env(events, **options)).run()
+
+
+def theorem(within='chapter', counter='theorem'):
+    return ('theorem', counter, within)
+
+
+# index.rst: a title and a toctree of chapters
+def book(*chapters):
+    return {'index': [('section', 1), ('toctree', 1, list(chapters))]}
+
+
+def test_counter_is_importable_from_directives():
+    from sphinx_clatex import directives, numbering
+    assert directives.Counter is numbering.Counter
+
+
+def test_alph():
+    assert [alph(value) for value in (1, 2, 26, 27, 52, 53)] == \
+        ['A', 'B', 'Z', 'AA', 'AZ', 'BA']
+
+
+def test_unscoped_counter():
+    events = book('a', 'b')
+    events['a'] = [('section', 1), theorem(None), theorem(None)]
+    events['b'] = [('section', 1), theorem(None)]
+    assert number(events) == {('a', 0): '1', ('a', 1): '2', ('b', 0): '3'}
+
+
+def test_within_chapter_is_reset_by_chapters():
+    events = book('a', 'b')
+    # a section inside the chapter does not reset the counter
+    events['a'] = [('section', 1), theorem(), ('section', 2), theorem()]
+    events['b'] = [('section', 1), theorem()]
+    assert number(events) == {('a', 0): '1.1', ('a', 1): '1.2',
+                              ('b', 0): '2.1'}
+
+
+def test_within_section():
+    events = book('a')
+    events['a'] = [('section', 1), theorem('section'),
+                   ('section', 2), theorem('section'), theorem('section'),
+                   ('section', 2), theorem('section')]
+    assert number(events) == {('a', 0): '1.0.1', ('a', 1): '1.1.1',
+                              ('a', 2): '1.1.2', ('a', 3): '1.2.1'}
+
+
+def test_shared_counter():
+    events = book('a')
+    events['a'] = [('section', 1), theorem(), theorem(counter='definition'),
+                   theorem()]
+    numbers = number(events)
+    assert [numbers['a', index] for index in range(3)] == \
+        ['1.1', '1.1', '1.2']
+
+
+def test_nested_toctrees():
+    events = book('a', 'c')
+    # b is included after a section of a: its title is a section
+    events['a'] = [('section', 1), ('section', 2), ('toctree', 1, ['b']),
+                   theorem('section')]
+    events['b'] = [('section', 1), theorem('section')]
+    events['c'] = [('section', 1), theorem('section')]
+    assert number(events) == {('b', 0): '1.2.1', ('a', 0): '1.2.2',
+                              ('c', 0): '2.0.1'}
+
+
+def test_without_chapters():
+    # article: the top sectioning unit is the section
+    events = book('a', 'b')
+    events['a'] = [('section', 1), theorem('section')]
+    events['b'] = [('section', 1), ('section', 2), theorem('section'),
+                   theorem('subsection', counter='lemma')]
+    assert number(events, clatex_use_chapters=False) == \
+        {('a', 0): '1.1', ('b', 0): '2.1', ('b', 1): '2.1.1'}
+
+
+def test_parts_do_not_reset_chapters():
+    events = book('p1', 'p2')
+    events['p1'] = [('section', 1), ('toctree', 1, ['a', 'b'])]
+    events['p2'] = [('section', 1), ('toctree', 1, ['c'])]
+    for docname in 'abc':
+        events[docname] = [('section', 1), theorem()]
+    # the chapter numbers go on across the parts, which are not part of
+    # the theorem numbers
+    assert number(events, latex_use_parts=True) == \
+        {('a', 0): '1.1', ('b', 0): '2.1', ('c', 0): '3.1'}
+
+
+def test_within_part():
+    events = book('p1', 'p2')
+    events['p1'] = [('section', 1), theorem('part'),
+                    ('toctree', 1, ['a'])]
+    events['p2'] = [('section', 1), theorem('part')]
+    events['a'] = [('section', 1), theorem('part')]
+    assert number(events, latex_use_parts=True) == \
+        {('p1', 0): '1', ('a', 0): '2', ('p2', 0): '1'}
+
+
+def test_appendices():
+    events = book('a', 'b')
+    events['a'] = [('section', 1), theorem(), theorem(None, 'remark')]
+    events['b'] = [('section', 1), theorem()]
+    events['app1'] = [('section', 1), theorem(), theorem(None, 'remark')]
+    events['app2'] = [('section', 1), theorem(), ('section', 1), theorem()]
+    assert number(events, latex_appendices=['app1', 'app2']) == {
+        ('a', 0): '1.1', ('a', 1): '1', ('b', 0): '2.1',
+        ('app1', 0): 'A.1', ('app1', 1): '2',
+        ('app2', 0): 'B.1', ('app2', 1): 'C.1'}
+
+
+def test_appendices_with_parts():
+    events = book('p1')
+    events['p1'] = [('section', 1), ('toctree', 1, ['a', 'b'])]
+    events['a'] = [('section', 1), theorem()]
+    events['b'] = [('section', 1), theorem()]
+    # the appendix is a part; its chapters are numbered A, B
+    events['app'] = [('section', 1), ('toctree', 1, ['c'])]
+    events['c'] = [('section', 1), theorem()]
+    assert number(events, latex_use_parts=True,
+                  latex_appendices=['app']) == \
+        {('a', 0): '1.1', ('b', 0): '2.1', ('c', 0): 'A.1'}
+
+
+def test_orphans_come_last():
+    events = book('a')
+    events['a'] = [('section', 1), theorem()]
+    events['orphan'] = [('section', 1), theorem()]
+    assert number(events) == {('a', 0): '1.1', ('orphan', 0): '2.1'}
+
+
+def test_unknown_unit():
+    app = App()
+    events = book('a')
+    events['a'] = [('section', 1), theorem('chapitre')]
+    assert TheoremNumbering(app, Env(events)).run() == {('a', 0): '1'}
+    assert len(app.warnings) == 1
+
+
+def labelled(events, labels=None, refs=None):
+    env = Env(events)
+    env.clatex_theorem_labels = labels or {}
+    env.clatex_theorem_refs = refs or {}
+    return env
+
+
+def test_changed_documents():
+    app = App()
+    events = book('a', 'b', 'c')
+    for docname in 'abc':
+        events[docname] = [('section', 1), theorem()]
+    env = labelled(events)
+    assert number_theorems(app, env) == ['a', 'b', 'c']
+    assert number_theorems(app, env) == []
+    # a new chapter before b renumbers b and c, but not a
+    events['index'][1][2].insert(1, 'new')
+    events['new'] = [('section', 1), theorem()]
+    env.all_docs['new'] = 0
+    assert number_theorems(app, env) == ['b', 'c', 'new']
+    assert env.clatex_theorem_numbers[('c', 0)] == '4.1'
+    # a theorem removed from a changes nothing else
+    events['a'] = [('section', 1)]
+    assert number_theorems(app, env) == ['a']
+
+
+def test_changed_references():
+    app = App()
+    events = book('a', 'b', 'c')
+    events['a'] = [('section', 1), theorem()]
+    events['b'] = [('section', 1), theorem()]
+    events['c'] = [('section', 1)]
+    env = labelled(events,
+                   labels={'a': {}, 'b': {'main': ('Theorem', 0, 'main')},
+                           'c': {}},
+                   refs={'a': set(), 'b': set(), 'c': set(['main'])})
+    assert number_theorems(app, env) == ['a', 'b', 'c']
+    assert env.clatex_theorem_index == {'main': ('Theorem', '2.1', 'b',
+                                                 'main')}
+    # c only refers to the theorem of b, which is renumbered
+    events['a'].append(theorem())
+    events['index'][1][2][:2] = ['b', 'a']
+    assert number_theorems(app, env) == ['a', 'b', 'c']
+    assert env.clatex_theorem_index['main'][1] == '1.1'
+    # the label moves to another document
+    env.clatex_theorem_labels = {'a': {'main': ('Lemma', 1, 'lemma')},
+                                 'b': {}, 'c': {}}
+    assert number_theorems(app, env) == ['c']
+    assert env.clatex_theorem_index == {'main': ('Lemma', '2.2', 'a',
+                                                 'lemma')}
+
+
+def test_duplicate_labels():
+    app = App()
+    events = book('a', 'b')
+    events['a'] = [('section', 1), theorem()]
+    events['b'] = [('section', 1), theorem()]
+    env = labelled(events,
+                   labels={'a': {'main': ('Theorem', 0, 'main')},
+                           'b': {'main': ('Theorem', 0, 'main')}})
+    number_theorems(app, env)
+    assert env.clatex_theorem_index['main'][2] == 'a'
+    assert len(app.warnings) == 1
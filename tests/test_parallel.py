@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the parallel writing of targets (clatex_parallel_write).
+"""
+
+from os import path
+
+from conftest import CONF
+from sphinx_clatex.builder import LaTeXBuilder
+
+FILES = {
+    'conf.py': CONF + """\
+latex_documents.extend([
+    ('one', 'one.tex', u'One', u'Author', 'manual'),
+    ('two', 'two.tex', u'Two', u'Author', 'manual'),
+])
+""",
+    'index.rst': u"""\
+Title
+=====
+
+.. toctree::
+
+   one
+   two
+""",
+    'one.rst': u"""\
+One
+===
+
+A footnote [#f]_ and a reference to :doc:`two`.
+
+.. [#f] The footnote.
+
+.. theorem:: first
+
+   Text.
+""",
+    'two.rst': u"""\
+Two
+===
+
+.. code-block:: python
+
+   print 'two'
+""",
+}
+
+TARGETS = ('test.tex', 'one.tex', 'two.tex')
+
+
+def build(make_app, **confoverrides):
+    app = make_app(FILES, **confoverrides)
+    app.build(force_all=True)
+    outputs = {}
+    for targetname in TARGETS:
+        with open(path.join(app.builder.outdir, targetname)) as f:
+            outputs[targetname] = f.read()
+    return outputs, app.builder
+
+
+def test_parallel_output_is_the_same(make_app, monkeypatch):
+    serial, builder = build(make_app)
+    calls = []
+    write_parallel = LaTeXBuilder.write_parallel
+    def spy(self, entries, *args):
+        calls.append(len(entries))
+        return write_parallel(self, entries, *args)
+    monkeypatch.setattr(LaTeXBuilder, 'write_parallel', spy)
+    parallel, builder = build(make_app, clatex_parallel_write=3)
+    assert calls == [3]
+    assert sorted(builder.written_targets) == sorted(TARGETS)
+    assert parallel == serial
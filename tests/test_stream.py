@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the streaming output (clatex_stream_output).
+"""
+
+from os import path
+
+FILES = {
+    'index.rst': u"""\
+Title
+=====
+
+.. toctree::
+
+   chapter
+
+Text with a footnote [#f]_ and a citation [CIT]_.
+
+.. [#f] The footnote.
+
+.. [CIT] The text of the citation, with *emphasis* and ``literal`` parts
+   that is long enough to be flushed.
+""",
+    'chapter.rst': u"""\
+Chapter
+=======
+
+Section
+-------
+
+A paragraph which refers to [OTHER]_.
+
+.. [OTHER] Another citation.
+
+   With a second paragraph.
+
+.. figure:: missing.png
+
+   The caption.
+
+=====  =====
+a      b
+=====  =====
+1      2
+=====  =====
+
+.. code-block:: python
+
+   print 'code'
+
+Term
+    Definition.
+""",
+}
+
+
+def build(make_app, **confoverrides):
+    app = make_app(FILES, **confoverrides)
+    app.build(force_all=True)
+    with open(path.join(app.builder.outdir, 'test.tex')) as f:
+        return f.read()
+
+
+def test_streamed_output_is_the_same(make_app):
+    expected = build(make_app)
+    assert 'The text of the citation' in expected
+    # flush after every node
+    assert build(make_app, clatex_stream_output=True,
+                 clatex_stream_chunk_size=1) == expected
+    assert build(make_app, clatex_stream_output=True,
+                 clatex_stream_chunk_size=100) == expected
+
+
+def test_citations_stay_in_the_bibliography(make_app):
+    output = build(make_app, clatex_stream_output=True,
+                   clatex_stream_chunk_size=1)
+    body, bibliography = output.split('\\begin{thebibliography}')
+    assert 'The text of the citation' not in body
+    assert 'The text of the citation' in bibliography
+    assert 'With a second paragraph' in bibliography
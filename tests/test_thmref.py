@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the thmref role and of the targets written again when the theorems
+it refers to are renumbered.
+"""
+
+from os import path
+
+from conftest import CONF
+
+FILES = {
+    'conf.py': CONF + """\
+latex_documents.append(('other', 'other.tex', u'Other', u'Author', 'manual'))
+""",
+    'index.rst': u"""\
+Title
+=====
+
+.. toctree::
+
+   chapter
+""",
+    'chapter.rst': u"""\
+Chapter
+=======
+
+.. theorem:: main
+   :name: main-theorem
+
+   Text.
+""",
+    'other.rst': u"""\
+:orphan:
+
+Other
+=====
+
+See :thmref:`main-theorem`.
+""",
+}
+
+INSERTED = u"""\
+.. theorem:: first
+
+   Text.
+
+"""
+
+
+def build(make_app, files=FILES, **confoverrides):
+    app = make_app(files, **confoverrides)
+    app.build()
+    with open(path.join(app.builder.outdir, 'other.tex')) as f:
+        return f.read(), app.builder.written_targets
+
+
+def renumbered():
+    files = dict(FILES)
+    files['chapter.rst'] = files['chapter.rst'].replace(
+        u'.. theorem:: main', INSERTED + u'.. theorem:: main')
+    return files
+
+
+def test_renumbered_reference_in_another_target(make_app):
+    output, written = build(make_app)
+    assert 'Theorem 1' in output
+    # other.rst is not read again, but its reference changed
+    output, written = build(make_app, renumbered())
+    assert sorted(written) == ['other.tex', 'test.tex']
+    assert 'Theorem 2' in output
+
+
+def test_renumbered_reference_with_assembled_cache(make_app):
+    build(make_app, clatex_assembled_cache=True)
+    output, written = build(make_app, renumbered(),
+                            clatex_assembled_cache=True)
+    assert 'Theorem 2' in output
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the lookup of target titles for distant references
+(sphinx_clatex.titles).
+"""
+
+import random
+
+from sphinx_clatex.titles import TitleIndex
+
+
+def linear_scan(titles, docname):
+    # the lookup of assemble_doctree before the index
+    for subdir, title in titles:
+        if docname.startswith(subdir):
+            return title
+    return None
+
+
+def check(titles, docnames):
+    index = TitleIndex(titles)
+    for docname in docnames:
+        assert index.lookup(docname) == linear_scan(titles, docname), docname
+        # memoized
+        assert index.lookup(docname) == linear_scan(titles, docname)
+
+
+def test_first_target_wins():
+    docnames = ['manual/intro', 'manual', 'man', 'faq', '', 'manual/api/x']
+    check([('manual/', 'Manual'), ('', 'Everything')], docnames)
+    # the catch-all first hides the others
+    check([('', 'Everything'), ('manual/', 'Manual')], docnames)
+    # a longer prefix listed after a shorter one does not win
+    check([('manual/', 'Manual'), ('manual/api/', 'API')], docnames)
+    check([('manual/api/', 'API'), ('manual/', 'Manual')], docnames)
+    # the same directory twice
+    check([('manual/', 'First'), ('manual/', 'Second')], docnames)
+    check([], docnames)
+
+
+def test_same_as_linear_scan():
+    rng = random.Random(0)
+    parts = ['a', 'b', 'ab', 'a/', 'b/', 'c/d/']
+    for attempt in range(200):
+        titles = [(''.join(rng.choice(parts)
+                           for i in range(rng.randrange(3))),
+                   'Title %d' % number)
+                  for number in range(rng.randrange(1, 6))]
+        docnames = [''.join(rng.choice(parts)
+                            for i in range(rng.randrange(5)))
+                    for number in range(20)]
+        check(titles, docnames)
+
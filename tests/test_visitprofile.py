@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the profile of the translator by node type (clatex_profile_visitors).
+"""
+
+from os import path
+
+FILES = {
+    'index.rst': u"""\
+Title
+=====
+
+A *first* and a *second* emphasis, :math:`x^2` and
+:textcolor:`<#FF0000> red text`.
+
+.. theorem:: title
+
+   Text of the theorem.
+
+.. align:: center
+
+   Centered.
+""",
+}
+
+
+def build(make_app, **confoverrides):
+    app = make_app(FILES, **confoverrides)
+    app.build(force_all=True)
+    with open(path.join(app.builder.outdir, 'test.tex')) as f:
+        return f.read(), app
+
+
+def test_profile(make_app):
+    expected, app = build(make_app)
+    assert app.builder.visitor_profile is None
+    output, app = build(make_app, clatex_profile_visitors=5)
+    # profiling does not change the output
+    assert output == expected
+    profile = app.builder.visitor_profile
+    visits, visit, depart, chars = profile.stats['emphasis']
+    assert visits == 2
+    # the text is appended by the visitor of the Text node
+    assert chars == 2 * len('\\emph{}')
+    # the clatex visitors are profiled too
+    for nodetype in ('thmnode_theorem', 'align', 'textcolor', 'math'):
+        assert profile.stats[nodetype][0] == 1
+    table = profile.table(5)
+    # a header, the five node types with the most time and the totals
+    assert len(table) == 7
+    assert table[-1].startswith('visitors ')
+    assert 'translator profile:' in app._status.getvalue()